@@ -0,0 +1,271 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`aggregate` is a module of addytool used to keep rolling alert counts.
+
+    :class:`AlertAggregator` counts alerts per agentid, fact, name, level and
+    status over rolling windows (1h, 24h and 7d by default). Each window is a
+    ring of time buckets plus running totals, so adding an alert costs one
+    counter update per window and dimension, expired buckets are subtracted
+    from the totals as time moves on, and top-N queries read the totals
+    directly instead of regrouping every alert.
+    """
+
+import endpoint, workflow, collections, heapq, threading, time
+
+WINDOWS = (
+    ('1h', 3600, 60),
+    ('24h', 86400, 900),
+    ('7d', 604800, 3600),
+    )
+DIMENSIONS = ('agentid', 'fact', 'name', 'level', 'status')
+
+class Window(object):
+    'Ring of time buckets with running totals per dimension.'
+
+    def __init__(self, span, width, dimensions = DIMENSIONS):
+        """Initializes an empty window.
+
+        Args:
+            span (int): Length of the window in seconds.
+            width (int): Length of each bucket in seconds.
+            dimensions (tuple of str): Alert keys to count.
+        """
+        self.span = span
+        self.width = width
+        self.size = max(1, span // width)
+        self.dimensions = dimensions
+        self.buckets = {}
+        self.totals = dict((dimension, collections.Counter()) \
+            for dimension in dimensions)
+        self.total = 0
+        self.current = None
+
+    def advance(self, now):
+        'Expires buckets that fell out of the window at time `now`.'
+        index = int(now // self.width)
+        if self.current is not None and index <= self.current:
+            return
+        oldest = index - self.size + 1
+        expired = [bucket for bucket in self.buckets if bucket < oldest]
+        for bucket in expired:
+            self._expire(bucket)
+        self.current = index
+
+    def add(self, timestamp, alert):
+        """Counts an alert created at `timestamp`.
+
+        Returns:
+            True if counted, False if the alert is older than the window.
+        """
+        index = int(timestamp // self.width)
+        if self.current is not None:
+            if index > self.current:
+                self.advance(timestamp)
+            elif index <= self.current - self.size:
+                return False
+        else:
+            self.current = index
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            bucket = self.buckets[index] = [0, dict((dimension, \
+                collections.Counter()) for dimension in self.dimensions)]
+        bucket[0] += 1
+        self.total += 1
+        for dimension in self.dimensions:
+            value = alert.get(dimension)
+            if value is None:
+                continue
+            bucket[1][dimension][value] += 1
+            self.totals[dimension][value] += 1
+        return True
+
+    def _expire(self, index):
+        count, counters = self.buckets.pop(index)
+        self.total -= count
+        for dimension, counter in counters.items():
+            totals = self.totals[dimension]
+            for value, amount in counter.items():
+                remaining = totals[value] - amount
+                if remaining > 0:
+                    totals[value] = remaining
+                else:
+                    del totals[value]
+
+class AlertAggregator(object):
+    """Rolling alert counts for dashboards.
+
+    Alerts are counted once, by `_id`, in the buckets of their `created_on`
+    time. Later status changes of an alert already counted are not applied.
+    """
+
+    def __init__(self, windows = WINDOWS, dimensions = DIMENSIONS, \
+            clock = time.time):
+        """Initializes empty windows.
+
+        Args:
+            windows (tuple): (name, span seconds, bucket seconds) tuples.
+            dimensions (tuple of str): Alert keys to count.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.windows = collections.OrderedDict((name, Window(span, width, \
+            dimensions)) for name, span, width in windows)
+        self.dimensions = dimensions
+        self.clock = clock
+        self.horizon = max(span for name, span, width in windows)
+        self.lock = threading.Lock()
+        self.seen = {}
+        self.seen_order = []
+
+    def add(self, alert):
+        """Counts one alert, unless it was already counted.
+
+        Args:
+            alert (dict): An item of `Alerts.get()`.
+        Returns:
+            True if the alert was new.
+        """
+        with self.lock:
+            return self._add(alert, self.clock()) == 'new'
+
+    def add_many(self, alerts):
+        """Counts many alerts.
+
+        Args:
+            alerts (iterable of dict): e.g. a page of `Alerts.get()`.
+        Returns:
+            Number of new alerts (int).
+        """
+        return self._add_page(alerts)[0]
+
+    def _add_page(self, alerts):
+        'Counts alerts. Returns (new alerts, alerts whose `_id` was seen).'
+        new = seen = 0
+        with self.lock:
+            now = self.clock()
+            for alert in alerts:
+                outcome = self._add(alert, now)
+                if outcome == 'new':
+                    new += 1
+                elif outcome == 'seen':
+                    seen += 1
+        return new, seen
+
+    def poll(self, alerts = None, status = None, per_page = 100, \
+            max_pages = None):
+        """Feeds alerts from `api/alerts` page by page.
+
+        Paging stops at the first full page on which every alert was already
+        counted, which assumes the endpoint lists the newest alerts first, or
+        after `max_pages`. Alerts older than the longest window do not stop
+        paging, so an endpoint listing the oldest alerts first is read to the
+        end.
+
+        Args:
+            alerts (endpoint.Alerts): Optionally, the endpoint to read.
+            status (str): Optionally, only read alerts with this status.
+            per_page (int): Alerts requested per page. The maximum is 100.
+            max_pages (int): Optionally, the most pages to read.
+        Returns:
+            Number of new alerts (int).
+        """
+        if alerts is None:
+            alerts = endpoint.Alerts()
+        kwargs = {}
+        if status is not None:
+            kwargs['status'] = status
+        page, added, pages = [], 0, 0
+        for alert in workflow.paginate(alerts.get, per_page = per_page, **kwargs):
+            page.append(alert)
+            if len(page) < per_page:
+                continue
+            new, seen = self._add_page(page)
+            added += new
+            page = []
+            pages += 1
+            if seen == per_page or (max_pages is not None and pages >= max_pages):
+                return added
+        return added + self._add_page(page)[0]
+
+    def top(self, dimension, n = 10, window = '24h'):
+        """Returns the values with the most alerts in a window.
+
+        Args:
+            dimension (str): e.g. 'agentid' for the noisiest devices, or
+                'fact' for the noisiest facts.
+            n (int): Number of values returned.
+            window (str): Window name, e.g. '1h', '24h' or '7d'.
+        Returns:
+            Python list of (value, count) tuples, highest count first.
+        """
+        with self.lock:
+            totals = self._window(window).totals[dimension]
+            return heapq.nlargest(n, totals.items(), key = lambda item: item[1])
+
+    def counts(self, dimension, window = '24h'):
+        """Returns every value's alert count in a window.
+
+        Returns:
+            Python dictionary of value to count.
+        """
+        with self.lock:
+            return dict(self._window(window).totals[dimension])
+
+    def total(self, window = '24h'):
+        'Returns the number of alerts in a window.'
+        with self.lock:
+            return self._window(window).total
+
+    def summary(self, n = 10):
+        """Returns totals and top-N values of every dimension and window.
+
+        Returns:
+            Python dictionary of window name to a dictionary with "total" and
+            one list of (value, count) tuples per dimension.
+        """
+        summary = {}
+        for name in self.windows:
+            summary[name] = {'total': self.total(name)}
+            for dimension in self.dimensions:
+                summary[name][dimension] = self.top(dimension, n, name)
+        return summary
+
+    def _window(self, name):
+        'Returns an up-to-date window. Hold `lock` while reading it.'
+        window = self.windows[name]
+        window.advance(self.clock())
+        return window
+
+    def _add(self, alert, now):
+        """Counts one alert. Hold `lock`.
+
+        Returns:
+            'new', 'seen' if its `_id` was already counted, or None if it has
+            no time or is older than the longest window.
+        """
+        alert_id = alert.get('_id')
+        timestamp = alert.get('created_on')
+        if timestamp is None:
+            return None
+        timestamp = float(timestamp)
+        if timestamp <= now - self.horizon:
+            return None
+        if alert_id is not None:
+            if alert_id in self.seen:
+                return 'seen'
+            self.seen[alert_id] = timestamp
+            heapq.heappush(self.seen_order, (timestamp, alert_id))
+            self._forget(now)
+        counted = False
+        for window in self.windows.values():
+            window.advance(now)
+            if timestamp > now - window.span:
+                counted = window.add(min(timestamp, now), alert) or counted
+        return 'new' if counted else None
+
+    def _forget(self, now):
+        'Drops ids of alerts older than the longest window.'
+        cutoff = now - self.horizon
+        while self.seen_order and self.seen_order[0][0] < cutoff:
+            timestamp, alert_id = heapq.heappop(self.seen_order)
+            if self.seen.get(alert_id) == timestamp:
+                del self.seen[alert_id]
@@ -0,0 +1,381 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`analytics` is a module of addytool used to measure application version
+    drift across the fleet.
+
+    :func:`version_drift` splits the per-agent records of `api/applications`
+    into shards of devices and maps them in worker processes, so the work
+    spreads across every core. Each worker keeps the devices of its shards
+    and returns only its version counts; the parent merges them, sends back
+    the most common version of every application, and each worker answers
+    with just the devices running an older one. The result is a
+    :class:`VersionReport` with per-app version histograms, the latest
+    version seen, and those outlier devices. Versions are compared with
+    `versions`, like everywhere else in addytool.
+
+    Example:
+        report = analytics.version_drift()
+        report.histogram('Google Chrome')
+        report.top_outliers(20)
+    """
+
+import endpoint, versions, collections, multiprocessing
+
+class _Partial(object):
+    """The shards mapped by one worker.
+
+    Device indexes stay in the worker: the parent only receives version
+    counts, and, once the fleet's most common versions are known, the devices
+    running an older one.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+
+    def add(self, shard):
+        """Maps one shard of devices.
+
+        Args:
+            shard (tuple): (offset, devices, key) where `devices` is a list of
+                `api/applications` records and `offset` the index of the first.
+        """
+        offset, devices, key = shard
+        indexes = self.indexes
+        for index, device in enumerate(devices, offset):
+            seen = set()
+            for application in device.get('installed_applications') or ():
+                name = application.get(key)
+                if name is None or name in seen:
+                    continue
+                seen.add(name)
+                pair = (name, application.get('version'))
+                devices_on = indexes.get(pair)
+                if devices_on is None:
+                    indexes[pair] = [index]
+                else:
+                    devices_on.append(index)
+
+    def counts(self):
+        """Returns (versions, unparsed) where `versions` maps application name
+        to normalized version to [sort key, devices], and `unparsed` maps
+        application name to the number of versions that could not be parsed.
+        """
+        counts, unparsed = {}, {}
+        for (name, version), devices_on in self.indexes.items():
+            parsed = _parse(version)
+            if parsed is None:
+                unparsed[name] = unparsed.get(name, 0) + len(devices_on)
+                continue
+            by_version = counts.setdefault(name, {})
+            entry = by_version.get(parsed[1])
+            if entry is None:
+                by_version[parsed[1]] = [parsed[0], len(devices_on)]
+            else:
+                entry[1] += len(devices_on)
+        return counts, unparsed
+
+    def behind(self, expected):
+        """Returns the devices running an older version than expected.
+
+        Args:
+            expected (dict): Application name to (normalized version, sort
+                key), as returned by `VersionReport.expected`.
+        Returns:
+            Python dictionary of application name to normalized version to
+            device indexes.
+        """
+        behind = {}
+        for (name, version), devices_on in self.indexes.items():
+            if name not in expected:
+                continue
+            parsed = _parse(version)
+            if parsed is None or parsed[0] >= expected[name][1]:
+                continue
+            by_version = behind.setdefault(name, {})
+            by_version.setdefault(parsed[1], []).extend(devices_on)
+        return behind
+
+def _parse(version):
+    'Returns `versions.parse(version)`, or None for unhashable versions.'
+    try:
+        return versions.parse(version)
+    except TypeError:
+        return None
+
+def _work(tasks, connection):
+    """Runs in a worker process: maps shards from `tasks` until None, sends
+    the counts over `connection`, then answers one `expected` dictionary with
+    the lagging devices. An exception is sent instead of a result."""
+    partial, error = _Partial(), None
+    for shard in iter(tasks.get, None):
+        if error is None:
+            try:
+                partial.add(shard)
+            except Exception as exception:
+                error = exception
+    connection.send(error if error is not None else partial.counts())
+    expected = connection.recv()
+    if error is None:
+        connection.send(partial.behind(expected))
+    connection.close()
+
+def _receive(connection):
+    'Returns the next result of a worker, raising the exception it sent.'
+    result = connection.recv()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def _shards(applications, shard_size, key, agentids):
+    'Yields shards of `applications`, recording each device\'s agentid.'
+    shard = []
+    for device in applications:
+        agentids.append(device.get('agentid'))
+        shard.append(device)
+        if len(shard) >= shard_size:
+            yield len(agentids) - len(shard), shard, key
+            shard = []
+    if shard:
+        yield len(agentids) - len(shard), shard, key
+
+class VersionReport(object):
+    """Merged version statistics of the fleet.
+
+    Attributes:
+        devices (int): Number of device records analyzed.
+        versions (dict): Application name to normalized version to
+            [sort key, devices].
+        unparsed (dict): Application name to the number of devices whose
+            version could not be parsed.
+        behind (dict): Application name to normalized version to the indexes
+            of devices running that version, for every version older than
+            the most common one.
+        agentids (list): Agentid of each device index.
+        min_devices (int): Applications reported by fewer devices have no
+            outliers.
+    """
+
+    def __init__(self, agentids = None, min_devices = 10):
+        self.agentids = agentids if agentids is not None else []
+        self.min_devices = min_devices
+        self.versions = {}
+        self.unparsed = collections.Counter()
+        self.behind = {}
+        self._outliers = None
+
+    @property
+    def devices(self):
+        return len(self.agentids)
+
+    def merge(self, counts):
+        'Adds the version counts of one worker, as from `_Partial.counts`.'
+        versions, unparsed = counts
+        for name, by_version in versions.items():
+            merged = self.versions.get(name)
+            if merged is None:
+                self.versions[name] = by_version
+                continue
+            for normalized, (key, devices) in by_version.items():
+                entry = merged.get(normalized)
+                if entry is None:
+                    merged[normalized] = [key, devices]
+                else:
+                    entry[1] += devices
+        self.unparsed.update(unparsed)
+
+    def expected(self):
+        """Returns the most common version of every application reported by
+        at least `min_devices` devices.
+
+        Returns:
+            Python dictionary of application name to (normalized version,
+            sort key).
+        """
+        expected = {}
+        for name, by_version in self.versions.items():
+            if sum(entry[1] for entry in by_version.values()) >= \
+                    self.min_devices:
+                mode = self._mode(name)
+                expected[name] = (mode, by_version[mode][0])
+        return expected
+
+    def merge_behind(self, behind):
+        'Adds the lagging devices of one worker, as from `_Partial.behind`.'
+        for name, by_version in behind.items():
+            merged = self.behind.setdefault(name, {})
+            for normalized, indexes in by_version.items():
+                merged.setdefault(normalized, []).extend(indexes)
+        self._outliers = None
+
+    def applications(self):
+        'Returns the names of every application seen, sorted.'
+        return sorted(self.versions)
+
+    def histogram(self, name):
+        """Returns the number of devices on each version of an application.
+
+        Args:
+            name (str): Application name, e.g. 'Google Chrome'.
+        Returns:
+            Python list of (version, devices) tuples, oldest version first.
+        """
+        by_version = self.versions.get(name, {})
+        return [(normalized, by_version[normalized][1]) for normalized \
+            in sorted(by_version, key = lambda item: by_version[item][0])]
+
+    def latest(self, name = None):
+        """Returns the newest version seen of one or every application.
+
+        Args:
+            name (str): Optionally, an application name.
+        Returns:
+            Python dictionary with "version", "devices" and "share" (of the
+            devices reporting the application), or, without `name`, a
+            dictionary of application name to such dictionaries.
+        """
+        if name is None:
+            return dict((name, self.latest(name)) for name in self.versions)
+        by_version = self.versions.get(name)
+        if not by_version:
+            return None
+        newest = max(by_version, key = lambda item: by_version[item][0])
+        return self._row(name, newest)
+
+    def common(self, name):
+        """Returns the version installed on the most devices, the newest one
+        on a tie, in the same form as `latest`."""
+        if not self.versions.get(name):
+            return None
+        return self._row(name, self._mode(name))
+
+    def outliers(self):
+        """Returns devices running an older version of an application than
+        the fleet's most common version.
+
+        Returns:
+            Python dictionary of agentid to a list of dictionaries with the
+            keys "name", "version" and "expected".
+        """
+        if self._outliers is not None:
+            return self._outliers
+        outliers = {}
+        for name, by_version in self.behind.items():
+            expected = self._mode(name)
+            for normalized, indexes in by_version.items():
+                lag = {'name': name, 'version': normalized, \
+                    'expected': expected}
+                for index in indexes:
+                    outliers.setdefault(self.agentids[index], []).append(lag)
+        self._outliers = outliers
+        return outliers
+
+    def top_outliers(self, n = 10):
+        """Returns the devices behind on the most applications.
+
+        Returns:
+            Python list of (agentid, lagging applications) tuples, most
+            lagging applications first.
+        """
+        outliers = self.outliers()
+        ranked = sorted(outliers, key = lambda agentid: -len(outliers[agentid]))
+        return [(agentid, outliers[agentid]) for agentid in ranked[:n]]
+
+    def summary(self):
+        """Returns one row per application.
+
+        Returns:
+            Python list of dictionaries with the keys "name", "devices",
+            "versions", "latest", "common", "behind" and "unparsed", sorted
+            by name.
+        """
+        rows = []
+        for name in self.applications():
+            by_version = self.versions[name]
+            devices = sum(entry[1] for entry in by_version.values())
+            common = self._mode(name)
+            common_key = by_version[common][0]
+            rows.append({
+                'name': name,
+                'devices': devices,
+                'versions': len(by_version),
+                'latest': self.latest(name)['version'],
+                'common': common,
+                'behind': sum(count for key, count in by_version.values() \
+                    if key < common_key) if devices >= self.min_devices else 0,
+                'unparsed': self.unparsed.get(name, 0),
+                })
+        return rows
+
+    def _mode(self, name):
+        by_version = self.versions[name]
+        return max(by_version, key = lambda item: (by_version[item][1], \
+            by_version[item][0]))
+
+    def _row(self, name, normalized):
+        by_version = self.versions[name]
+        devices = by_version[normalized][1]
+        total = sum(entry[1] for entry in by_version.values())
+        return {'version': normalized, 'devices': devices, \
+            'share': devices / float(total)}
+
+def version_drift(applications = None, processes = None, shard_size = 500, \
+        key = 'name', min_devices = 10):
+    """Computes version statistics of every installed application.
+
+    Args:
+        applications (iterable of dict): Optionally, `Applications.get()`
+            records. Streamed with `Applications.stream()` when omitted, so
+            workers start on the first shards while the rest downloads.
+        processes (int): Worker processes. Defaults to the number of cores.
+            1 runs everything in this process.
+        shard_size (int): Devices per shard sent to a worker.
+        key (str): Application field identifying an application, e.g.
+            'name' or 'path'.
+        min_devices (int): Only report outliers of applications reported by
+            at least this many devices.
+    Returns:
+        :class:`VersionReport`
+    """
+    if applications is None:
+        applications = endpoint.Applications().stream()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    report = VersionReport(min_devices = min_devices)
+    shards = _shards(applications, shard_size, key, report.agentids)
+    if processes <= 1:
+        partial = _Partial()
+        for shard in shards:
+            partial.add(shard)
+        report.merge(partial.counts())
+        report.merge_behind(partial.behind(report.expected()))
+        return report
+    tasks = multiprocessing.Queue(processes * 2)
+    workers, connections, finished = [], [], False
+    try:
+        for _ in range(processes):
+            connection, child = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target = _work, \
+                args = (tasks, child))
+            worker.daemon = True
+            worker.start()
+            child.close()
+            workers.append(worker)
+            connections.append(connection)
+        for shard in shards:
+            tasks.put(shard)
+        for worker in workers:
+            tasks.put(None)
+        for connection in connections:
+            report.merge(_receive(connection))
+        expected = report.expected()
+        for connection in connections:
+            connection.send(expected)
+        for connection in connections:
+            report.merge_behind(_receive(connection))
+        finished = True
+    finally:
+        for worker in workers:
+            if not finished:
+                worker.terminate()
+            worker.join()
+    return report
@@ -0,0 +1,385 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`catalog` is a module of addytool used to search software items locally.
+
+    :class:`CatalogIndex` keeps a slim copy of every `CatalogPublic` and
+    `CustomSoftware` item, without the embedded scripts, and indexes it by:
+        - an inverted index of tokens from name, label, base_identifier and
+          category, with a sorted vocabulary for prefix search,
+        - a trigram index over the vocabulary for fuzzy search,
+        - a per-base_identifier list of items sorted by version.
+    The index is saved to a gzipped JSON file and refreshed incrementally:
+    only items whose content changed since the last refresh are re-indexed.
+    Searches walk posting lists sorted by (name, version), so they stop as
+    soon as `limit` items have matched instead of collecting every match.
+    """
+
+import endpoint, versions, bisect, gzip, hashlib, heapq, json, math, re
+
+FIELDS = ('name', 'label', 'base_identifier', 'category')
+KEPT = FIELDS + ('instructionId', 'identifier', 'version', 'provider', \
+    'public', 'type', 'description')
+_WORD = re.compile(r'[0-9a-z]+')
+# A search that scans _SCAN_BUDGET items without finishing intersects the
+# postings instead, and sorts the matches directly if there are at most
+# _SORT_LIMIT of them.
+_SCAN_BUDGET = 200
+_SORT_LIMIT = 256
+
+def tokenize(text):
+    'Returns the lowercase alphanumeric tokens of `text`.'
+    if not text:
+        return []
+    return _WORD.findall(text.lower())
+
+def version_key(version):
+    """Returns a sort key for version strings, as `versions.key`: '10.2b1'
+    sorts after '9.9' and before both '10.2' and '10.2.1', and '10.2' and
+    '10.2.0' are equal.
+    """
+    return versions.key(version)
+
+def _trigrams(token):
+    padded = '  %s ' % token
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class CatalogIndex(object):
+    'Local, searchable index over `CatalogPublic` and `CustomSoftware`.'
+
+    def __init__(self, path = None):
+        """Initializes the index, loading it from `path` if that file exists.
+
+        Args:
+            path (str): Optionally, a gzipped JSON file used by `save` and
+                `load`, e.g. 'addytool-catalog.json.gz'.
+        """
+        self.path = path
+        self.items = {}
+        self.digests = {}
+        self.postings = {}
+        self.trigrams = {}
+        self.by_base = {}
+        self.order = {}
+        self.tokens = {}
+        self._vocabulary = None
+        self._ranked = None
+        self._ranks = None
+        self._sorted = {}
+        if path is not None:
+            try:
+                self.load(path)
+            except IOError:
+                pass
+
+    def __len__(self):
+        return len(self.items)
+
+    def refresh(self, public = None, custom = None):
+        """Re-indexes items that were added, changed or removed.
+
+        Args:
+            public (list of dict): Optionally, `CatalogPublic.get()` output.
+                Fetched when omitted.
+            custom (list of dict): Optionally, `CustomSoftware.get()` output.
+                Fetched when omitted.
+        Returns:
+            Python dictionary with the number of items "added", "updated",
+            "removed" and "unchanged".
+        """
+        if public is None:
+            public = endpoint.CatalogPublic().get()
+        if custom is None:
+            custom = endpoint.CustomSoftware().get()
+        counts = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        seen = set()
+        for source, items in (('public', public), ('custom', custom)):
+            for item in items or []:
+                item_id = item.get('instructionId')
+                if item_id is None or item_id in seen:
+                    continue
+                seen.add(item_id)
+                digest = hashlib.sha1(json.dumps(item, sort_keys = True, \
+                    default = str).encode('utf-8')).hexdigest()
+                if self.digests.get(item_id) == digest:
+                    counts['unchanged'] += 1
+                    continue
+                counts['updated' if item_id in self.items else 'added'] += 1
+                self.add(item, source, digest)
+        for item_id in [item_id for item_id in self.items if item_id not in seen]:
+            self.remove(item_id)
+            counts['removed'] += 1
+        if self.path is not None and (counts['added'] or counts['updated'] \
+                or counts['removed']):
+            self.save(self.path)
+        return counts
+
+    def add(self, item, source = 'custom', digest = None):
+        """Indexes one software item, replacing any item with the same
+        instructionId.
+
+        Args:
+            item (dict): A `CatalogPublic` or `CustomSoftware` item.
+            source (str): 'public' or 'custom'.
+            digest (str): Optionally, a digest of the full item.
+        """
+        item_id = item['instructionId']
+        if item_id in self.items:
+            self.remove(item_id)
+        slim = dict((key, item.get(key)) for key in KEPT if key in item)
+        slim['source'] = source
+        self.items[item_id] = slim
+        self.order[item_id] = ((slim.get('name') or '').lower(), \
+            version_key(slim.get('version')))
+        if digest is not None:
+            self.digests[item_id] = digest
+        tokens = self.tokens[item_id] = frozenset(self._tokens(slim))
+        self._ranks = None
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = set()
+                for trigram in _trigrams(token):
+                    self.trigrams.setdefault(trigram, set()).add(token)
+                self._vocabulary = None
+            postings.add(item_id)
+        base = slim.get('base_identifier')
+        if base is not None:
+            versions = self.by_base.setdefault(base, [])
+            entry = (version_key(slim.get('version')), item_id)
+            versions.insert(bisect.bisect(versions, entry), entry)
+
+    def remove(self, item_id):
+        'Removes one item from the index.'
+        slim = self.items.pop(item_id, None)
+        self.digests.pop(item_id, None)
+        self.order.pop(item_id, None)
+        tokens = self.tokens.pop(item_id, ())
+        if slim is None:
+            return
+        self._ranks = None
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(item_id)
+            if not postings:
+                del self.postings[token]
+                for trigram in _trigrams(token):
+                    tokens = self.trigrams.get(trigram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self.trigrams[trigram]
+                self._vocabulary = None
+        base = slim.get('base_identifier')
+        if base in self.by_base:
+            self.by_base[base] = [entry for entry in self.by_base[base] \
+                if entry[1] != item_id]
+            if not self.by_base[base]:
+                del self.by_base[base]
+
+    def search(self, query, limit = 20, prefix = True, fuzzy = False):
+        """Finds items whose indexed fields contain every token of `query`.
+
+        Args:
+            query (str): e.g. 'google chr'.
+            limit (int): Maximum number of items returned.
+            prefix (bool): Whether the last token of `query` may match the
+                start of a longer token. (Default is True)
+            fuzzy (bool): Whether tokens without an exact (or prefix) match
+                fall back to similar tokens, for misspellings.
+        Returns:
+            Python list of slim item dictionaries, sorted by name.
+        """
+        tokens = tokenize(query)
+        if not tokens or limit <= 0:
+            return []
+        terms = []
+        for position, token in enumerate(tokens):
+            last = position == len(tokens) - 1
+            matched = self._lookup(token, prefix and last)
+            if not matched and fuzzy:
+                matched = self.similar(token)
+            if not matched:
+                return []
+            terms.append(matched)
+        sizes = [sum(len(self.postings[token]) for token in term) \
+            for term in terms]
+        self._rank()
+        driver = self._plan(terms, sizes, limit)
+        if driver is None:
+            ranks = range(len(self._ranked))
+        else:
+            streams = [self._ordered(token) for token in terms[driver]]
+            ranks = streams[0] if len(streams) == 1 else heapq.merge(*streams)
+        others = [set(term) for position, term in enumerate(terms) \
+            if position != driver]
+        results, previous, budget, matches = [], None, _SCAN_BUDGET, None
+        for rank in ranks:
+            if rank == previous:
+                continue
+            previous = rank
+            item_id = self._ranked[rank]
+            if matches is not None:
+                if item_id not in matches:
+                    continue
+            else:
+                budget -= 1
+                if budget == 0:
+                    # Few items match so far: intersect the postings instead.
+                    matches = self._intersect(terms)
+                    if len(matches) <= _SORT_LIMIT:
+                        return [self.items[item_id] for item_id in \
+                            heapq.nsmallest(limit, matches, \
+                            key = self._ranks.__getitem__)]
+                    if item_id not in matches:
+                        continue
+                else:
+                    item_tokens = self.tokens[item_id]
+                    matched = True
+                    for other in others:
+                        if other.isdisjoint(item_tokens):
+                            matched = False
+                            break
+                    if not matched:
+                        continue
+            results.append(self.items[item_id])
+            if len(results) == limit:
+                break
+        return results
+
+    def similar(self, token, limit = 5, threshold = 0.4):
+        """Returns indexed tokens similar to `token`, most similar first.
+
+        Similarity is the Jaccard index of the tokens' trigrams.
+
+        Args:
+            token (str): A single query token.
+            limit (int): Maximum number of tokens returned.
+            threshold (float): Minimum similarity, from 0 to 1.
+        """
+        grams = _trigrams(token.lower())
+        shared = {}
+        for gram in grams:
+            for candidate in self.trigrams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        scored = []
+        for candidate, count in shared.items():
+            score = count / float(len(grams) + len(candidate) + 1 - count)
+            if score >= threshold:
+                scored.append((-score, candidate))
+        scored.sort()
+        return [candidate for score, candidate in scored[:limit]]
+
+    def versions(self, base_identifier):
+        """Returns every item of a software, sorted by version, oldest first.
+
+        Args:
+            base_identifier (str): e.g. 'Google Chrome'.
+        Returns:
+            Python list of slim item dictionaries.
+        """
+        return [self.items[item_id] for key, item_id \
+            in self.by_base.get(base_identifier, [])]
+
+    def latest(self, base_identifier):
+        'Returns the newest version of a software, or None.'
+        versions = self.by_base.get(base_identifier)
+        if not versions:
+            return None
+        return self.items[versions[-1][1]]
+
+    def save(self, path = None):
+        """Writes the items and their digests to a gzipped JSON file. The
+        token indexes are rebuilt on load.
+
+        Args:
+            path (str): Optionally, the file to write. Defaults to `path`.
+        """
+        path = path or self.path
+        data = {
+            'version': 1,
+            'items': self.items,
+            'digests': self.digests,
+            }
+        with gzip.open(path, 'wb') as output:
+            output.write(json.dumps(data, separators = (',', ':')).encode('utf-8'))
+
+    def load(self, path = None):
+        """Replaces the index with the contents of a file written by `save`.
+
+        Args:
+            path (str): Optionally, the file to read. Defaults to `path`.
+        """
+        path = path or self.path
+        with gzip.open(path, 'rb') as saved:
+            data = json.loads(saved.read().decode('utf-8'))
+        self.items, self.digests, self.postings = {}, {}, {}
+        self.trigrams, self.by_base, self.order = {}, {}, {}
+        self.tokens, self._vocabulary, self._ranks = {}, None, None
+        for item_id, slim in data['items'].items():
+            self.add(slim, slim.get('source', 'custom'), \
+                data['digests'].get(item_id))
+
+    def _tokens(self, slim):
+        tokens = set()
+        for field in FIELDS:
+            value = slim.get(field)
+            if isinstance(value, (str, type(u''))):
+                tokens.update(tokenize(value))
+        return tokens
+
+    def _lookup(self, token, prefix):
+        'Returns the indexed tokens equal to `token`, or starting with it.'
+        if not prefix:
+            return [token] if token in self.postings else []
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        start = bisect.bisect_left(vocabulary, token)
+        end = bisect.bisect_left(vocabulary, token + u'\uffff', start)
+        return vocabulary[start:end]
+
+    def _plan(self, terms, sizes, limit):
+        """Returns the position of the term whose items a search walks, or
+        None to walk every item. Each choice is costed by the tokens merged
+        plus the items expected to be scanned before `limit` match, assuming
+        the terms are independent."""
+        total = float(max(1, len(self.items)))
+        densities = [max(size / total, 1.0 / total) for size in sizes]
+        expected = float(limit)
+        for density in densities:
+            expected /= density
+        best, driver = min(expected, total), None
+        for position, term in enumerate(terms):
+            scanned = min(sizes[position], expected * densities[position])
+            cost = len(term) + scanned * (1 + math.log(len(term), 2))
+            if cost < best:
+                best, driver = cost, position
+        return driver
+
+    def _intersect(self, terms):
+        'Returns the ids of the items matching every term.'
+        sets = [self.postings[term[0]] if len(term) == 1 else \
+            set().union(*[self.postings[token] for token in term]) \
+            for term in terms]
+        sets.sort(key = len)
+        return sets[0].intersection(*sets[1:])
+
+    def _rank(self):
+        """Numbers the items in (name, version) order. Ranks are rebuilt on
+        the first search after a change."""
+        if self._ranks is None:
+            self._ranked = sorted(self.items, key = self.order.__getitem__)
+            self._ranks = dict((item_id, rank) for rank, item_id \
+                in enumerate(self._ranked))
+            self._sorted = {}
+
+    def _ordered(self, token):
+        'Returns the sorted ranks of the items with `token`.'
+        ordered = self._sorted.get(token)
+        if ordered is None:
+            ranks = self._ranks
+            ordered = self._sorted[token] = sorted(ranks[item_id] \
+                for item_id in self.postings[token])
+        return ordered
@@ -8,15 +8,251 @@
     will use keychain if on macOS.
     """
 
-import requests, keyring, json
+import requests, keyring, json, time, codecs, threading, tracing
+
+hooks = []
+transport = None
+# `last.response` is the most recent response received by `send` in the
+# current thread, so callers of the endpoint methods (which return decoded
+# JSON only) can still check its status.
+last = threading.local()
+
+def add_hook(hook):
+    """Registers a request hook.
+
+    Hooks are objects with optional `before_request(context)` and
+    `after_request(context)` methods, called around every HTTP attempt made
+    through :func:`send`. `context` is a dictionary with the keys:
+        "endpoint" (str): Class name of the client, e.g. 'Alerts'.
+        "method" (str): HTTP method.
+        "url" (str): Requested URL.
+        "attempt" (int): 0 for the first attempt, 1 for the first retry, etc.
+        "start" (float): time.time() when the attempt started.
+    and, for `after_request` only:
+        "elapsed" (float): Seconds taken by the attempt.
+        "response" (requests.Response): The response, or None on error.
+        "error" (Exception): The exception raised, or None.
+        "request_bytes" (int): Size of the request body.
+        "response_bytes" (int): Size of the response body.
+    Hooks may add their own keys to `context`.
+
+    Args:
+        hook (object): The hook to register.
+    Returns:
+        `hook`
+    """
+    if hook not in hooks:
+        hooks.append(hook)
+    return hook
+
+def remove_hook(hook):
+    'Unregisters a request hook added with `add_hook`.'
+    if hook in hooks:
+        hooks.remove(hook)
+
+def _call_hooks(name, context):
+    'Calls `name` on every registered hook that defines it.'
+    for hook in list(hooks):
+        function = getattr(hook, name, None)
+        if function is not None:
+            function(context)
+
+def _response_bytes(response, streamed):
+    'Returns the body size without consuming streamed responses.'
+    if streamed:
+        try:
+            return int(response.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return 0
+    return len(response.content or b'')
+
+def _uploads(kwargs):
+    'Returns the file objects in the `files` and `data` of a request.'
+    values = []
+    files = kwargs.get('files')
+    if isinstance(files, dict):
+        values.extend(files.values())
+    elif files:
+        values.extend(value for name, value in files)
+    values.append(kwargs.get('data'))
+    uploads = []
+    for value in values:
+        if isinstance(value, (tuple, list)) and len(value) > 1:
+            value = value[1]
+        if hasattr(value, 'read'):
+            uploads.append(value)
+    return uploads
+
+def _positions(uploads):
+    'Returns the position of each file object, or None if one cannot seek.'
+    try:
+        return [upload.tell() for upload in uploads]
+    except (AttributeError, IOError, OSError):
+        return None
+
+def send(client, method, url, **kwargs):
+    """Shared request path for all endpoints.
+
+    Requests are sent through the client's `session` when it has one (e.g. an
+    organization's connection pool), otherwise through :mod:`requests`. When
+    the client has a `rate_limiter`, a token is acquired before each attempt.
+    Responses with status 429 are retried up to `client.max_retries` times,
+    honoring any Retry-After header. File objects in `files` or `data` are
+    rewound before a retry; requests whose files cannot be rewound are not
+    retried. Registered hooks (see `add_hook`) are
+    called around every attempt. When a module-level `transport` is installed
+    (see :mod:`transport`), it sends the request instead.
+
+    Args:
+        client (Endpoint or FileUpload): Object providing `headers` and,
+            optionally, `session`, `rate_limiter` and `max_retries`.
+        method (str): HTTP method, e.g. 'GET'.
+        url (str): Full URL to request.
+        **kwargs: Passed to :func:`requests.request`.
+    Returns:
+        :class:`requests.Response`
+    """
+    session = getattr(client, 'session', None) or requests
+    rate_limiter = getattr(client, 'rate_limiter', None)
+    max_retries = getattr(client, 'max_retries', 0)
+    uploads = _uploads(kwargs)
+    positions = _positions(uploads) if uploads else []
+    if positions is None:
+        max_retries = 0
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        context = {
+            'endpoint': client.__class__.__name__,
+            'method': method,
+            'url': url,
+            'attempt': attempt,
+            'start': time.time(),
+            }
+        _call_hooks('before_request', context)
+        try:
+            if transport is not None:
+                response = transport.request(session, method, url, \
+                  headers = client.headers, **kwargs)
+            else:
+                response = session.request(method, url, \
+                  headers = client.headers, **kwargs)
+        except Exception as error:
+            context.update(elapsed = time.time() - context['start'], \
+              response = None, error = error, request_bytes = 0, \
+              response_bytes = 0)
+            _call_hooks('after_request', context)
+            raise
+        body = getattr(getattr(response, 'request', None), 'body', None)
+        context.update(elapsed = time.time() - context['start'], \
+          response = response, error = None, \
+          request_bytes = len(body) if body else 0, \
+          response_bytes = _response_bytes(response, kwargs.get('stream')))
+        _call_hooks('after_request', context)
+        last.response = response
+        if response.status_code != 429 or attempt == max_retries:
+            return response
+        try:
+            for upload, position in zip(uploads, positions):
+                upload.seek(position)
+        except (AttributeError, IOError, OSError):
+            return response
+        retry_after = response.headers.get('Retry-After')
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = 2 ** attempt
+        time.sleep(delay)
+
+_WHITESPACE = ' \t\r\n'
+_DELIMITERS = _WHITESPACE + ',]'
+
+def iter_json_array(chunks):
+    """Decodes the items of a JSON array as its bytes arrive.
+
+    Only one item and one chunk are held in memory at a time, rather than the
+    whole response.
+
+    Args:
+        chunks (iterable of bytes): UTF-8 encoded JSON array, in pieces.
+    Returns:
+        Generator of decoded items.
+    Raises:
+        ValueError: If the document is not a single, complete JSON array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    # expect: '[' first, then 'first' (an item or ']'), 'item' (after a
+    # comma), 'separator' (',' or ']') and 'end' (only whitespace).
+    buffer, expect, finished = '', '[', False
+    chunks = iter(chunks)
+    while not finished:
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+            buffer += utf8.decode(b'', final = True)
+        else:
+            buffer += utf8.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+            character = buffer[position]
+            if expect == 'end':
+                raise ValueError('Unexpected data after JSON array: %r' % \
+                  buffer[position:position + 80])
+            if expect == '[':
+                if character != '[':
+                    raise ValueError('Expected a JSON array, got: %r' % \
+                      buffer[position:position + 80])
+                expect, position = 'first', position + 1
+                continue
+            if expect == 'separator' or (expect == 'first' and character == ']'):
+                if character == ']':
+                    expect, position = 'end', position + 1
+                elif character == ',':
+                    expect, position = 'item', position + 1
+                else:
+                    raise ValueError('Expected , or ] in JSON array, got: %r' \
+                      % buffer[position:position + 80])
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if finished:
+                    raise
+                break
+            if end == len(buffer) or buffer[end] not in _DELIMITERS:
+                # A number may continue in the next chunk, e.g. '2.' + '5'.
+                if not finished and not isinstance(item, (dict, list)):
+                    break
+                if end < len(buffer):
+                    raise ValueError('Expected , or ] in JSON array, got: %r' \
+                      % buffer[end:end + 80])
+            yield item
+            expect, position = 'separator', end
+        buffer = buffer[position:]
+    if expect != 'end':
+        raise ValueError('Incomplete JSON array')
 
 class Endpoint(object):
     """Use GET, POST, PUT, and DELETE methods with Addigy endpoints.
 
     <Subclass>.__init__ pass endpoint_url to Endpoint.__init__, and subclass
     methods pass params, json, etc.
+
+    Endpoints created with `organizations.Organization.endpoint` use that
+    organization's credentials, connection pool and rate limiter. `base_url`
+    may be overridden on the class, e.g. to point at a local mock server.
     """
     __version = '0.0.1'
+    base_url = "https://prod.addigy.com/"
+    organization = None
+    session = None
+    rate_limiter = None
+    max_retries = 3
 
     def __init__(self, endpoint_url, client_id = None, client_secret = None):
         """Initializes variables shared across subclasses.
@@ -25,17 +261,35 @@ class Endpoint(object):
         except for file manager endpoints. Concatenates base_url and endpoint
         URL to form full path to endpoint.
         """
-        if client_id is None:
-            client_id = str(keyring.get_password('Addigy', 'ClientID'))
-        if client_secret is None:
-            client_secret = str(keyring.get_password('Addigy', 'ClientSecret'))
-        self.base_url = "https://prod.addigy.com/"
+        if self.organization is not None:
+            client_id, client_secret = self.organization.credentials( \
+              client_id, client_secret)
+            self.session = self.organization.session
+            self.rate_limiter = self.organization.rate_limiter
+        if client_id is None or client_secret is None:
+            with tracing.span('keyring.get_password', 'keyring'):
+                if client_id is None:
+                    client_id = str(keyring.get_password('Addigy', 'ClientID'))
+                if client_secret is None:
+                    client_secret = str(keyring.get_password('Addigy', \
+                      'ClientSecret'))
         self.url = str(self.base_url + endpoint_url)
         self.headers = {
             'client-id': client_id,
             'client-secret': client_secret,
             }
 
+    def request(self, method, **kwargs):
+        """Call API endpoint through the shared request path.
+
+        Args:
+            method (str): HTTP method, e.g. 'GET'.
+            **kwargs: Passed to :func:`requests.request`.
+        Returns:
+            :class:`requests.Response`
+        """
+        return send(self, method, self.url, **kwargs)
+
     def get(self, params = None, files = None):
         """Call API endpoint with GET
 
@@ -46,9 +300,10 @@ class Endpoint(object):
             Python dictionaries.
         """
 
-        response = requests.get(self.url, params = params, \
-          headers = self.headers)
-        return json.loads(response.text)
+        with tracing.span(self.__class__.__name__ + '.get', 'endpoint'):
+            response = self.request('GET', params = params)
+            with tracing.span('json.loads', 'decode'):
+                return json.loads(response.text)
 
     def post(self, data = None, json_data = None):
         """Call API endpoint with POST.
@@ -61,10 +316,12 @@ class Endpoint(object):
             Python dictionaries.
         """
 
-        response = requests.post(self.url, headers = self.headers, data = data, json = json_data)
-        return json.loads(response.text)
+        with tracing.span(self.__class__.__name__ + '.post', 'endpoint'):
+            response = self.request('POST', data = data, json = json_data)
+            with tracing.span('json.loads', 'decode'):
+                return json.loads(response.text)
 
-    def put(self):
+    def put(self, data = None):
         """Call API endpoint with PUT.
 
         Args:
@@ -75,8 +332,10 @@ class Endpoint(object):
             Python dictionaries.
         """
 
-        response = requests.put(self.url, headers = self.headers, data = data)
-        return json.loads(response.text)
+        with tracing.span(self.__class__.__name__ + '.put', 'endpoint'):
+            response = self.request('PUT', data = data)
+            with tracing.span('json.loads', 'decode'):
+                return json.loads(response.text)
 
     def delete(self, json_data = None):
         """Call API endpoint with DELETE.
@@ -86,8 +345,31 @@ class Endpoint(object):
         Returns:
         """
 
-        response = requests.delete(self.url, headers = self.headers, json = json_data)
-        return json.loads(response.text)
+        with tracing.span(self.__class__.__name__ + '.delete', 'endpoint'):
+            response = self.request('DELETE', json = json_data)
+            with tracing.span('json.loads', 'decode'):
+                return json.loads(response.text)
+
+    def stream(self, params = None, chunk_size = 65536):
+        """Call API endpoint with GET and yield list items as they arrive.
+
+        Unlike `get`, the response is never held in memory as a whole, so
+        this suits large lists such as `Devices` or `Applications`.
+
+        Args:
+            params (dict): Optionally, define any parameters
+            chunk_size (int): Bytes read from the connection at a time.
+        Returns:
+            Generator of decoded JSON Objects.
+        """
+
+        with tracing.span(self.__class__.__name__ + '.stream', 'endpoint'):
+            response = self.request('GET', params = params, stream = True)
+        try:
+            for item in iter_json_array(response.iter_content(chunk_size)):
+                yield item
+        finally:
+            response.close()
 
 class Alerts(Endpoint):
     'Request api/alerts endpoint with GET method'
@@ -533,15 +815,32 @@ class FileUpload(object):
     'Request https://file-manager-prod.addigy.com/api/upload/url endpoint \
     with GET method. Request resulting URL with POST method.'
 
+    base_url = 'https://file-manager-prod.addigy.com/'
+    organization = None
+    session = None
+    rate_limiter = None
+    max_retries = 3
+
     def __init__(self):
         'Initializes unique variables.'
-        self.client_id = str(keyring.get_password('Addigy', 'ClientID'))
-        self.client_secret = str(keyring.get_password('Addigy', 'ClientSecret'))
+        self.client_id, self.client_secret = None, None
+        if self.organization is not None:
+            self.client_id, self.client_secret = \
+              self.organization.credentials(None, None)
+            self.session = self.organization.session
+            self.rate_limiter = self.organization.rate_limiter
+        if self.client_id is None or self.client_secret is None:
+            with tracing.span('keyring.get_password', 'keyring'):
+                if self.client_id is None:
+                    self.client_id = str(keyring.get_password('Addigy', \
+                      'ClientID'))
+                if self.client_secret is None:
+                    self.client_secret = str(keyring.get_password('Addigy', \
+                      'ClientSecret'))
         self.headers = {
             'client-id': self.client_id,
             'client-secret': self.client_secret,
             }
-        self.base_url = 'https://file-manager-prod.addigy.com/'
         self.endpoint_url = 'api/upload/url'
         self.url = str(self.base_url + self.endpoint_url)
 
@@ -554,7 +853,8 @@ class FileUpload(object):
         Returns:
             URL (str)
         """
-        self.response = requests.get(self.url, headers=self.headers)
+        with tracing.span('FileUpload.get', 'endpoint'):
+            self.response = send(self, 'GET', self.url)
         return self.response.text[1:-1] #Splice to omit outer quotes
 
     def post(self, file, url = None):
@@ -575,13 +875,13 @@ class FileUpload(object):
                    "created":"<TIME_STAMP>",
                    "provider":"cloud-storage"}'
         """
-        files = {'file': open(file, 'rb')}
-
         if url == None:
-            __file_upload = FileUpload()
-            url = __file_upload.get()
+            url = self.get()
 
-        self.response = requests.post(url, headers=self.headers, files=files)
+        with open(file, 'rb') as upload:
+            with tracing.span('FileUpload.post', 'endpoint'):
+                self.response = send(self, 'POST', url, \
+                  files = {'file': upload})
         return self.response.text
 
     def put(self):
@@ -863,7 +1163,7 @@ class Profiles(Endpoint):
         'Initialize unique variables.'
         Endpoint.__init__(self, endpoint_url = "api/profiles")
 
-    def get(self, __instruction_id = None):
+    def get(self, instruction_id = None):
         """Get list of profiles for the organization. If instruction_id is
             passed as GET parameter, returns only that instruction.
 
@@ -872,12 +1172,11 @@ class Profiles(Endpoint):
         Returns:
             Varied key/value pairings of various types.
         """
-        if __instruction_id is not None:
-            params ={
-                'instruction_id': __instruction_id
-                }
+        params = {}
+        if instruction_id is not None:
+            params['instruction_id'] = instruction_id
 
-        return Endpoint.get(self, __instruction_id)
+        return Endpoint.get(self, params = params)
 
     def delete(self, instruction_id = None):
         """Delete profile
@@ -916,7 +1215,8 @@ class Validate(Endpoint):
         Returns:
             True or False
         """
-        self.response = requests.post(self.url, headers=self.headers)
+        with tracing.span('Validate.post', 'endpoint'):
+            self.response = self.request('POST')
         if str(self.response.status_code) == '200':
             return True
         else:
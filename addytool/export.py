@@ -0,0 +1,255 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`export` is a module of addytool used to export Addigy data to files.
+
+    Records are streamed from the endpoint classes straight to NDJSON or CSV
+    files, optionally gzipped and rotated by size. `Devices` and
+    `Applications` are decoded item by item with `Endpoint.stream`, while
+    `Alerts` and `Maintenance` are read one page at a time, so memory use does
+    not grow with the size of the fleet.
+
+    Example:
+        export.export('applications', '/data/addigy', format = 'csv',
+            compress = True)
+    """
+
+import endpoint, workflow, csv, gzip, io, json, os, sys, time, warnings
+
+_PY2 = sys.version_info[0] == 2
+
+def device_records():
+    'Yields one record per device from `api/devices`.'
+    return endpoint.Devices().stream()
+
+def application_records():
+    """Yields one normalized row per installed application per device.
+
+    Each `installed_applications` item of `api/applications` becomes a row
+    with the keys agentid, name, path and version.
+    """
+    for device in endpoint.Applications().stream():
+        agentid = device.get('agentid')
+        for application in device.get('installed_applications') or []:
+            row = {'agentid': agentid}
+            row.update(application)
+            yield row
+
+def alert_records(status = None, per_page = 100):
+    'Yields every alert, one page at a time.'
+    alerts = endpoint.Alerts()
+    if status is None:
+        return workflow.paginate(alerts.get, per_page = per_page)
+    return workflow.paginate(alerts.get, per_page = per_page, status = status)
+
+def maintenance_records(per_page = 100):
+    'Yields every completed maintenance record, one page at a time.'
+    return workflow.paginate(endpoint.Maintenance().get, per_page = per_page)
+
+DATASETS = {
+    'devices': device_records,
+    'applications': application_records,
+    'alerts': alert_records,
+    'maintenance': maintenance_records,
+    }
+
+def flatten(record, separator = '.'):
+    """Flattens nested dictionaries into a single level.
+
+    Args:
+        record (dict): e.g. {'software_icon': {'id': 'x'}}
+        separator (str): Joins nested keys.
+    Returns:
+        Python dictionary, e.g. {'software_icon.id': 'x'}. Lists are kept
+        as they are.
+    """
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            for nested_key, nested_value in flatten(value, separator).items():
+                flat[key + separator + nested_key] = nested_value
+        else:
+            flat[key] = value
+    return flat
+
+class RotatingWriter(object):
+    """Write records to NDJSON or CSV files, starting a new file whenever the
+    current one reaches `max_bytes`.
+
+    Files are named '<prefix>-<index>.<ndjson|csv>[.gz]' with a four-digit
+    index starting at 0001. CSV columns are `fields` if given, otherwise the
+    keys of the first record; keys not among them are dropped, with a warning
+    for each dropped key when the columns were taken from the first record.
+    Nested values are written as JSON.
+    """
+
+    def __init__(self, prefix, format = 'ndjson', compress = False, \
+            max_bytes = 256 * 1024 * 1024, fields = None):
+        """Initializes the writer. The first file is created on the first
+        record.
+
+        Args:
+            prefix (str): Path prefix of the output files.
+            format (str): 'ndjson' or 'csv'.
+            compress (bool): Gzip the output files.
+            max_bytes (int): Rotate after a file reaches about this many
+                bytes on disk. Files may exceed it by the size of the write
+                buffers, as they are not flushed to check the size. None
+                disables rotation.
+            fields (list of str): Optionally, CSV columns.
+        """
+        if format not in ('ndjson', 'csv'):
+            raise ValueError("format must be 'ndjson' or 'csv'")
+        self.prefix = prefix
+        self.format = format
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.fields = list(fields) if fields is not None else None
+        self.inferred = fields is None
+        self.dropped = set()
+        self.paths = []
+        self.records = 0
+        self.raw = None
+        self.output = None
+        self.csv = None
+
+    def write(self, record):
+        'Writes one record, rotating files as needed.'
+        if self.output is None:
+            self._open()
+        if self.format == 'ndjson':
+            self.output.write(json.dumps(record, separators = (',', ':'), \
+                default = str) + '\n')
+        else:
+            self._write_csv(flatten(record))
+        self.records += 1
+        if self.max_bytes is not None and self._size() >= self.max_bytes:
+            self._close_file()
+
+    def write_all(self, records):
+        'Writes every record of an iterable and returns the number written.'
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        return count
+
+    def close(self):
+        'Closes the current file. Returns the paths of all files written.'
+        self._close_file()
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self):
+        path = '%s-%04d.%s' % (self.prefix, len(self.paths) + 1, self.format)
+        if self.compress:
+            path += '.gz'
+        self.raw = open(path, 'wb')
+        stream = self.raw
+        if self.compress:
+            stream = gzip.GzipFile(fileobj = self.raw, mode = 'wb')
+        if _PY2:
+            self.output = _Utf8Writer(stream)
+        else:
+            self.output = io.TextIOWrapper(stream, encoding = 'utf-8', \
+                newline = '')
+        self.paths.append(path)
+        if self.format == 'csv':
+            self.csv = None
+
+    def _write_csv(self, row):
+        if self.fields is None:
+            self.fields = sorted(row)
+            self._columns = set(self.fields)
+        if self.inferred:
+            dropped = [field for field in row if field not in self._columns \
+                and field not in self.dropped]
+            if dropped:
+                self.dropped.update(dropped)
+                warnings.warn('CSV columns were taken from the first record; '
+                    'dropping %s. Pass `fields` to keep them.' % \
+                    ', '.join(sorted(dropped)))
+        if self.csv is None:
+            self.csv = csv.writer(self.output)
+            self.csv.writerow(_csv_values(self.fields))
+        values = []
+        for field in self.fields:
+            value = row.get(field)
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, separators = (',', ':'), default = str)
+            elif value is None:
+                value = ''
+            values.append(value)
+        self.csv.writerow(_csv_values(values))
+
+    def _size(self):
+        'Returns the bytes on disk so far, without flushing the compressor.'
+        return self.raw.tell()
+
+    def _close_file(self):
+        if self.output is None:
+            return
+        self.output.close()
+        if not self.raw.closed:
+            self.raw.close()
+        self.raw = self.output = self.csv = None
+
+def _csv_values(values):
+    'Encodes unicode values to UTF-8, which the Python 2 `csv` module needs.'
+    if not _PY2:
+        return values
+    return [value.encode('utf-8') if isinstance(value, type(u'')) else value \
+        for value in values]
+
+class _Utf8Writer(object):
+    'Text writer over a binary stream for Python 2.'
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        if isinstance(text, type(u'')):
+            text = text.encode('utf-8')
+        self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+def export(dataset, directory = '.', format = 'ndjson', compress = False, \
+        max_bytes = 256 * 1024 * 1024, fields = None, records = None):
+    """Exports a dataset to rotating files.
+
+    Args:
+        dataset (str): 'devices', 'applications', 'alerts' or 'maintenance'.
+        directory (str): Directory in which to create the files.
+        format (str): 'ndjson' or 'csv'.
+        compress (bool): Gzip the output files.
+        max_bytes (int): Rotate after a file reaches about this many bytes
+            on disk.
+        fields (list of str): CSV columns. Required for CSV exports of
+            'devices', as devices report different facts; optional otherwise.
+        records (iterable): Optionally, records to write instead of fetching
+            `dataset`, e.g. `alert_records(status = 'Unattended')`.
+    Returns:
+        Python list of paths (str) of the files written.
+    Raises:
+        ValueError: If `fields` is missing for a CSV export of 'devices'.
+    """
+    if format == 'csv' and dataset == 'devices' and fields is None:
+        raise ValueError("CSV exports of 'devices' need `fields`, e.g. "
+            "['agentid', 'Device Name', 'OS Version']")
+    if records is None:
+        records = DATASETS[dataset]()
+    prefix = os.path.join(directory, '%s-%s' % (dataset, \
+        time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())))
+    with RotatingWriter(prefix, format = format, compress = compress, \
+            max_bytes = max_bytes, fields = fields) as writer:
+        writer.write_all(records)
+    return writer.paths
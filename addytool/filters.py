@@ -0,0 +1,314 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`filters` is a module of addytool used to select devices by their facts.
+
+    A filter expression such as::
+
+        "OS Version" < "14.0" and "Battery Percentage" < 20
+
+    is compiled once into a predicate over fact dictionaries. Fact names are
+    quoted (or bare words without spaces), values are quoted strings, numbers,
+    true, false or null. Comparisons are joined with `and`, `or`, `not` and
+    parentheses. Supported operators are ==, !=, <, <=, >, >= and `contains`.
+    Quoted values made of digits and dots (e.g. "14" or "10.14.3") compare as
+    versions, the same way as everywhere in addytool (see `versions`):
+    trailing zero components are ignored, so "14" == "14.0" == "14.0.0", and
+    pre-releases come first, so "14.0b1" < "14.0". Unquoted numbers compare
+    as versions against facts made of digits and dots too, so
+    "OS Version" < 14 matches "9.1" and "13.6.1".
+    Ordering never compares values of different kinds: a fact that is not a
+    number (or version) never matches <, <=, >, >= against a number (or
+    version), and true/false are not numbers.
+
+    Filters evaluate either row by row over `Devices.get()` output, or against
+    a :class:`Columns` index, where each comparison only scans one fact and
+    boolean operators become set operations on agentids.
+    """
+
+import versions, re
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*') |
+    (?P<number>-?\d+(?:\.\d+)?(?![\w.])) |
+    (?P<op>==|!=|<=|>=|=|<|>|\(|\)) |
+    (?P<word>[^\s"'()=!<>]+)
+    )''', re.VERBOSE)
+_VERSION = re.compile(r'^\d+(?:\.\d+)*$')
+_KEYWORDS = set(['and', 'or', 'not', 'contains'])
+_STRINGS = (str, type(u''))
+_NUMBERS = (int, type(2 ** 64), float)
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+class Filter(object):
+    """A compiled filter expression.
+
+    Call the filter with a fact dictionary to test a single device, or use
+    `select` to get the matching agentids from many devices.
+    """
+
+    def __init__(self, expression, key = 'agentid'):
+        """Compiles `expression`.
+
+        Args:
+            expression (str): The filter expression.
+            key (str): Fact used to identify devices.
+        Raises:
+            ValueError: If the expression cannot be parsed.
+        """
+        self.expression = expression
+        self.key = key
+        self.tree = _Parser(_tokenize(expression)).parse()
+        self.predicate = _compile(self.tree)
+
+    def __call__(self, facts):
+        return self.predicate(facts)
+
+    def __repr__(self):
+        return 'Filter(%r)' % self.expression
+
+    def select(self, devices):
+        """Returns the agentids of devices matching the filter.
+
+        Args:
+            devices: One of:
+                :class:`Columns`: evaluated column by column.
+                dict: agentid to fact dictionary, e.g. `SnapshotStore.load`.
+                list of dict: device facts, e.g. `Devices.get()`.
+        Returns:
+            Python list of agentids (str), ready for `DevicesCommands.post`
+            or `workflow.bulk_assign_policy`.
+        """
+        if isinstance(devices, Columns):
+            return sorted(_evaluate(self.tree, devices))
+        if isinstance(devices, dict):
+            return [agentid for agentid, facts in devices.items() \
+                if self.predicate(facts)]
+        return [facts[self.key] for facts in devices \
+            if self.key in facts and self.predicate(facts)]
+
+class Columns(object):
+    """Columnar index of device facts.
+
+    Each fact maps to a dictionary of agentid to value, so a comparison only
+    touches the devices that report that fact.
+    """
+
+    def __init__(self, devices, key = 'agentid'):
+        """Builds the index.
+
+        Args:
+            devices (list of dict or dict): Device facts, as returned by
+                `Devices.get()`, or agentid to facts as returned by
+                `SnapshotStore.load`.
+            key (str): Fact used to identify devices.
+        """
+        if isinstance(devices, dict):
+            devices = devices.items()
+        else:
+            devices = ((facts.get(key), facts) for facts in devices)
+        self.agentids = set()
+        self.columns = {}
+        for agentid, facts in devices:
+            if agentid is None:
+                continue
+            self.agentids.add(agentid)
+            for fact, value in facts.items():
+                self.columns.setdefault(fact, {})[agentid] = value
+
+def compile(expression, key = 'agentid'):
+    'Returns a :class:`Filter` for `expression`.'
+    return Filter(expression, key = key)
+
+def _tokenize(expression):
+    'Splits an expression into (kind, value) tuples.'
+    tokens, position = [], 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None or match.end() == position:
+            raise ValueError('Unexpected character at %d in filter: %r' % \
+                (position, expression))
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'number':
+            value = float(value) if '.' in value else int(value)
+        elif kind == 'op' and value == '=':
+            value = '=='
+        elif kind == 'word' and value.lower() in _KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+class _Parser(object):
+    'Recursive descent parser producing nested tuples.'
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError('Empty filter expression')
+        tree = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError('Unexpected %r in filter' % \
+                (self.tokens[self.position][1],))
+        return tree
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError('Unexpected end of filter')
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        tree = self.parse_and()
+        while self.peek() == ('keyword', 'or'):
+            self.take()
+            tree = ('or', tree, self.parse_and())
+        return tree
+
+    def parse_and(self):
+        tree = self.parse_not()
+        while self.peek() == ('keyword', 'and'):
+            self.take()
+            tree = ('and', tree, self.parse_not())
+        return tree
+
+    def parse_not(self):
+        if self.peek() == ('keyword', 'not'):
+            self.take()
+            return ('not', self.parse_not())
+        if self.peek() == ('op', '('):
+            self.take()
+            tree = self.parse_or()
+            if self.take() != ('op', ')'):
+                raise ValueError('Expected ) in filter')
+            return tree
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        kind, fact = self.take()
+        if kind not in ('string', 'word'):
+            raise ValueError('Expected a fact name, got %r' % (fact,))
+        kind, operator = self.take()
+        if (kind, operator) != ('keyword', 'contains') and \
+                (kind != 'op' or operator in ('(', ')')):
+            raise ValueError('Expected an operator after %r' % (fact,))
+        kind, value = self.take()
+        if kind == 'word':
+            if value.lower() not in _LITERALS:
+                raise ValueError('Unquoted value %r in filter' % (value,))
+            value = _LITERALS[value.lower()]
+        elif kind not in ('string', 'number'):
+            raise ValueError('Expected a value after %r' % (operator,))
+        return ('compare', fact, operator, value)
+
+def _version(value):
+    """Returns the `versions.parse` sort key of a version string or number,
+    e.g. the same key for "14", "14.0" and "14.0.0", otherwise None."""
+    parsed = versions.parse(value)
+    return parsed[0] if parsed is not None else None
+
+def _kind(value):
+    'Returns the kind of a value for ordering: string, bool or number.'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, _NUMBERS):
+        return 'number'
+    if isinstance(value, _STRINGS):
+        return 'string'
+    return type(value).__name__
+
+def _comparator(operator, value):
+    'Returns a function testing a single fact value against `value`.'
+    if operator == 'contains':
+        def test(fact):
+            try:
+                return value in fact
+            except TypeError:
+                return False
+        return test
+
+    if _kind(value) == 'number':
+        version = _version(value)
+        def coerce(fact):
+            if isinstance(fact, _STRINGS):
+                if version is not None and _VERSION.match(fact.strip()):
+                    return _version(fact), version
+                fact = float(fact)
+            if _kind(fact) != 'number':
+                raise TypeError('not a number')
+            return fact, value
+    elif isinstance(value, _STRINGS) and _VERSION.match(value.strip()):
+        version = _version(value)
+        def coerce(fact):
+            fact = _version(fact)
+            if fact is None:
+                raise TypeError('not a version')
+            return fact, version
+    else:
+        kind = _kind(value)
+        def coerce(fact):
+            if value is not None and _kind(fact) != kind:
+                raise TypeError('different kinds')
+            return fact, value
+
+    compare = {
+        '==': lambda a, b: a == b,
+        '!=': lambda a, b: a != b,
+        '<': lambda a, b: a < b,
+        '<=': lambda a, b: a <= b,
+        '>': lambda a, b: a > b,
+        '>=': lambda a, b: a >= b,
+        }[operator]
+
+    def test(fact):
+        if fact is None and value is not None:
+            return operator == '!='
+        try:
+            return compare(*coerce(fact))
+        except (TypeError, ValueError):
+            return operator == '!='
+    return test
+
+def _compile(tree):
+    'Compiles a parse tree into a predicate over fact dictionaries.'
+    if tree[0] == 'compare':
+        fact, test = tree[1], _comparator(tree[2], tree[3])
+        return lambda facts: test(facts.get(fact))
+    if tree[0] == 'not':
+        operand = _compile(tree[1])
+        return lambda facts: not operand(facts)
+    left, right = _compile(tree[1]), _compile(tree[2])
+    if tree[0] == 'and':
+        return lambda facts: left(facts) and right(facts)
+    return lambda facts: left(facts) or right(facts)
+
+def _evaluate(tree, columns):
+    'Evaluates a parse tree against a :class:`Columns` index to a set.'
+    if tree[0] == 'compare':
+        fact, test = tree[1], _comparator(tree[2], tree[3])
+        column = columns.columns.get(fact, {})
+        matches = set(agentid for agentid, value in column.items() \
+            if test(value))
+        if test(None):
+            matches.update(columns.agentids.difference(column))
+        return matches
+    if tree[0] == 'not':
+        return columns.agentids - _evaluate(tree[1], columns)
+    if tree[0] == 'and':
+        left = _evaluate(tree[1], columns)
+        if not left:
+            return left
+        return left & _evaluate(tree[2], columns)
+    return _evaluate(tree[1], columns) | _evaluate(tree[2], columns)
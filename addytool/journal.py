@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`journal` is a module of addytool used to make bulk operations resumable.
+
+    Every intended call is appended to a local SQLite journal before it is
+    made, and its result is appended once it returns. When a bulk job is run
+    again with the same journal and job name, calls that already completed are
+    skipped, so recovering from a crash costs only the remaining work.
+    `workflow.bulk` drives a job through `Journal.remaining` and
+    `Journal.call`.
+    """
+
+import endpoint, sqlite3, threading, hashlib, json, time
+
+class Journal(object):
+    """Append-only write-ahead journal of endpoint calls.
+
+    Entries are never updated or deleted. Each call appends an 'intent' row
+    before the request is sent and a 'done' or 'failed' row afterwards. A call
+    is 'failed' when it raises or when its last HTTP response has a status
+    outside 2xx, and complete when a 'done' row exists for its key within the
+    job, so failed calls are made again when the job is resumed.
+    """
+
+    def __init__(self, path = 'addytool-journal.sqlite'):
+        """Opens (or creates) the journal at `path`.
+
+        Args:
+            path (str): Location of the SQLite journal file. ':memory:' may be
+                used for a throwaway journal.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS entries (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            job TEXT NOT NULL,
+            key TEXT NOT NULL,
+            event TEXT NOT NULL,
+            operation TEXT,
+            arguments TEXT,
+            result TEXT,
+            time REAL NOT NULL)""")
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_job_event \
+            ON entries (job, event, key)')
+        self.connection.commit()
+
+    @staticmethod
+    def key(operation, arguments):
+        """Returns a stable key identifying a call.
+
+        Args:
+            operation (str): Name of the call, e.g. 'DevicesCommands.post'.
+            arguments (list): Positional arguments of the call.
+        Returns:
+            Hex digest (str) of the operation and its JSON-encoded arguments.
+        """
+        encoded = json.dumps([operation, arguments], sort_keys = True)
+        return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+    def append(self, job, key, event, operation = None, arguments = None, \
+            result = None):
+        'Appends a single row to the journal and commits it.'
+        with self.lock:
+            self.connection.execute('INSERT INTO entries (job, key, event, \
+                operation, arguments, result, time) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job, key, event, operation, arguments, result, time.time()))
+            self.connection.commit()
+
+    def completed(self, job):
+        """Returns the keys of all completed calls in a job.
+
+        Args:
+            job (str): Name of the bulk job.
+        Returns:
+            set of keys (str).
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT DISTINCT key FROM entries \
+                WHERE job = ? AND event = ?', (job, 'done')).fetchall()
+        return set(row[0] for row in rows)
+
+    def is_complete(self, job, key):
+        'Returns True if the call with `key` completed in a job.'
+        with self.lock:
+            row = self.connection.execute('SELECT 1 FROM entries WHERE \
+                job = ? AND event = ? AND key = ? LIMIT 1',
+                (job, 'done', key)).fetchone()
+        return row is not None
+
+    def result(self, job, key):
+        'Returns the decoded result of a completed call, or None.'
+        with self.lock:
+            row = self.connection.execute('SELECT result FROM entries WHERE \
+                job = ? AND key = ? AND event = ? ORDER BY seq DESC LIMIT 1',
+                (job, key, 'done')).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def remaining(self, job, method, arguments_list):
+        """Returns the calls that have not completed in a job.
+
+        Args:
+            job (str): Name of the bulk job.
+            method (bound method): Endpoint method to call.
+            arguments_list (list of list): Positional arguments for each call.
+        Returns:
+            Python list of the argument lists still to be called, in order.
+        """
+        operation = _operation_name(method)
+        done = self.completed(job)
+        return [list(arguments) for arguments in arguments_list \
+            if Journal.key(operation, list(arguments)) not in done]
+
+    def call(self, job, method, *args):
+        """Makes a single journaled call, unless it already completed.
+
+        Args:
+            job (str): Name of the bulk job.
+            method (bound method): Endpoint method to call, e.g.
+                `endpoint.PoliciesDevices().post`.
+            *args: Positional arguments passed to `method`.
+        Returns:
+            Result of the call, or the recorded result if it already completed.
+            A result decoded from an error response is returned as it is and
+            journaled as 'failed'.
+        """
+        operation = _operation_name(method)
+        arguments = list(args)
+        key = Journal.key(operation, arguments)
+        if self.is_complete(job, key):
+            return self.result(job, key)
+        return self._call(job, key, operation, method, arguments)
+
+    def _call(self, job, key, operation, method, arguments):
+        'Appends intent, calls `method`, then appends its outcome.'
+        self.append(job, key, 'intent', operation, json.dumps(arguments))
+        endpoint.last.response = None
+        try:
+            result = method(*arguments)
+        except Exception as error:
+            self.append(job, key, 'failed', operation, result = repr(error))
+            raise
+        response = getattr(endpoint.last, 'response', None)
+        event = 'done'
+        if response is not None and not 200 <= response.status_code < 300:
+            event = 'failed'
+        self.append(job, key, event, operation,
+            result = json.dumps(result, default = str))
+        return result
+
+    def close(self):
+        'Closes the journal file.'
+        with self.lock:
+            self.connection.close()
+
+def _operation_name(method):
+    'Returns "<Class>.<method>" for a bound method.'
+    owner = getattr(method, '__self__', None)
+    if owner is None:
+        return method.__name__
+    return owner.__class__.__name__ + '.' + method.__name__
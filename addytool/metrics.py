@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`metrics` is a module of addytool used to instrument calls to Addigy.
+
+    :class:`Metrics` is a request hook (see :func:`endpoint.add_hook`) that
+    records latency histograms, request and response bytes, retries and
+    status codes, labelled by endpoint class and HTTP method. Metrics can be
+    written to a file or served on a local port in the Prometheus text format.
+
+    Example:
+        import metrics
+        registry = metrics.Metrics().install()
+        registry.serve(9464)
+    """
+
+import endpoint, threading, os, tempfile
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, \
+    10.0, 30.0)
+
+class Histogram(object):
+    'Cumulative histogram in the style of Prometheus.'
+
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        'Adds one observation.'
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        'Returns (upper bound, cumulative count) pairs, ending with +Inf.'
+        pairs, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((repr(bound), total))
+        pairs.append(('+Inf', self.count))
+        return pairs
+
+class Metrics(object):
+    """Request metrics labelled by endpoint class and HTTP method.
+
+    Extra hooks may be attached with `add_hook`; they are called with the same
+    context as :func:`endpoint.add_hook` hooks, after metrics are recorded.
+    """
+
+    def __init__(self, buckets = LATENCY_BUCKETS, prefix = 'addytool'):
+        """Initializes empty metrics.
+
+        Args:
+            buckets (tuple of float): Latency histogram bucket bounds, in
+                seconds.
+            prefix (str): Prefix of exported metric names.
+        """
+        self.buckets = buckets
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.requests = {}
+        self.request_bytes = {}
+        self.response_bytes = {}
+        self.retries = {}
+        self.errors = {}
+        self.hooks = []
+        self.server = None
+
+    def install(self):
+        'Registers these metrics with :func:`endpoint.add_hook`.'
+        endpoint.add_hook(self)
+        return self
+
+    def uninstall(self):
+        'Unregisters these metrics.'
+        endpoint.remove_hook(self)
+
+    def add_hook(self, hook):
+        """Registers an extra hook called by these metrics.
+
+        Args:
+            hook (object): Object with optional `before_request(context)` and
+                `after_request(context)` methods.
+        """
+        self.hooks.append(hook)
+        return hook
+
+    def before_request(self, context):
+        'Calls extra `before_request` hooks.'
+        for hook in self.hooks:
+            if hasattr(hook, 'before_request'):
+                hook.before_request(context)
+
+    def after_request(self, context):
+        'Records one HTTP attempt, then calls extra `after_request` hooks.'
+        labels = (context['endpoint'], context['method'])
+        response = context.get('response')
+        status = str(response.status_code) if response is not None else 'error'
+        with self.lock:
+            histogram = self.latency.get(labels)
+            if histogram is None:
+                histogram = self.latency[labels] = Histogram(self.buckets)
+            histogram.observe(context['elapsed'])
+            _increment(self.requests, labels + (status,))
+            _increment(self.request_bytes, labels, context['request_bytes'])
+            _increment(self.response_bytes, labels, context['response_bytes'])
+            if context['attempt'] > 0:
+                _increment(self.retries, labels)
+            if context.get('error') is not None:
+                _increment(self.errors, labels + \
+                    (context['error'].__class__.__name__,))
+        for hook in self.hooks:
+            if hasattr(hook, 'after_request'):
+                hook.after_request(context)
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str
+        """
+        prefix, lines = self.prefix, []
+        with self.lock:
+            lines.append('# HELP %s_request_duration_seconds Latency of \
+requests to Addigy.' % prefix)
+            lines.append('# TYPE %s_request_duration_seconds histogram' % prefix)
+            for labels in sorted(self.latency):
+                histogram = self.latency[labels]
+                base = _labels(('endpoint', 'method'), labels)
+                for bound, count in histogram.cumulative():
+                    lines.append('%s_request_duration_seconds_bucket{%s,le="%s"} %d' \
+                        % (prefix, base, bound, count))
+                lines.append('%s_request_duration_seconds_sum{%s} %r' % \
+                    (prefix, base, histogram.sum))
+                lines.append('%s_request_duration_seconds_count{%s} %d' % \
+                    (prefix, base, histogram.count))
+            _counter(lines, prefix + '_requests_total', 'Requests by status \
+code.', ('endpoint', 'method', 'status'), self.requests)
+            _counter(lines, prefix + '_request_bytes_total', 'Request body \
+bytes sent.', ('endpoint', 'method'), self.request_bytes)
+            _counter(lines, prefix + '_response_bytes_total', 'Response body \
+bytes received.', ('endpoint', 'method'), self.response_bytes)
+            _counter(lines, prefix + '_retries_total', 'Retried requests.', \
+                ('endpoint', 'method'), self.retries)
+            _counter(lines, prefix + '_request_errors_total', 'Requests that \
+raised an exception.', ('endpoint', 'method', 'error'), self.errors)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Writes `render()` to `path`, atomically replacing any existing file,
+        e.g. for the node_exporter textfile collector.
+
+        Args:
+            path (str): Destination file, conventionally ending in '.prom'.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temporary = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+        with os.fdopen(handle, 'w') as output:
+            output.write(self.render())
+        # mkstemp creates the file readable only by its owner; collectors
+        # often run as another user.
+        os.chmod(temporary, 0o644)
+        os.rename(temporary, path)
+
+    def serve(self, port = 9464, host = '127.0.0.1'):
+        """Serves `render()` over HTTP from a background thread.
+
+        Args:
+            port (int): Local port to listen on. 0 picks a free port.
+            host (str): Address to bind. (Default is '127.0.0.1')
+        Returns:
+            The running server; its `server_port` attribute holds the port.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', \
+                    'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server
+
+    def shutdown(self):
+        'Stops the server started by `serve`.'
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def _increment(counters, labels, value = 1):
+    counters[labels] = counters.get(labels, 0) + value
+
+def _labels(names, values):
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\') \
+        .replace('"', '\\"')) for name, value in zip(names, values))
+
+def _counter(lines, name, description, names, counters):
+    lines.append('# HELP %s %s' % (name, description))
+    lines.append('# TYPE %s counter' % name)
+    for labels in sorted(counters):
+        lines.append('%s{%s} %d' % (name, _labels(names, labels), \
+            counters[labels]))
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`organizations` is a module of addytool used to work across many Addigy
+    organizations from a single process.
+
+    Each :class:`Organization` has its own credentials, connection pool and
+    rate limiter. Credentials are stored with :mod:`keyring` under the service
+    name 'Addigy-<orgid>', alongside the default 'Addigy' service used by
+    :class:`endpoint.Endpoint`. :class:`MultiOrg` runs an endpoint call across
+    all organizations concurrently and streams the results tagged with the
+    orgid, so one failing organization does not affect the others.
+    """
+
+import endpoint, requests, keyring, threading, time
+from multiprocessing.pool import ThreadPool
+
+class RateLimiter(object):
+    """Thread-safe token bucket.
+
+    Allows bursts of up to `burst` requests, refilled at `rate` requests per
+    second. `acquire` blocks until a token is available.
+    """
+
+    def __init__(self, rate = 5.0, burst = 10):
+        """Initializes a full bucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            burst (int): Maximum number of tokens in the bucket.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        'Takes one token, sleeping until one is available.'
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, \
+                    self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+class Organization(object):
+    'Credentials, connection pool and rate limiter of one organization.'
+
+    def __init__(self, orgid, client_id = None, client_secret = None, \
+            rate = 5.0, burst = 10, pool_size = 10):
+        """Initializes the organization. Credentials not given are read from
+        keyring under the service name 'Addigy-<orgid>'.
+
+        Args:
+            orgid (str): orgid UUID, or any unique name for the organization.
+            client_id (str): Optionally, the organization's API client id.
+            client_secret (str): Optionally, the organization's API client
+                secret.
+            rate (float): Requests per second allowed for this organization.
+            burst (int): Requests allowed in a burst for this organization.
+            pool_size (int): Connections kept open to each host.
+        """
+        self.orgid = orgid
+        self.service = 'Addigy-' + orgid
+        if client_id is None:
+            client_id = str(keyring.get_password(self.service, 'ClientID'))
+        if client_secret is None:
+            client_secret = str(keyring.get_password(self.service, 'ClientSecret'))
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections = pool_size, \
+            pool_maxsize = pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.rate_limiter = RateLimiter(rate, burst)
+
+    def __repr__(self):
+        return 'Organization(%r)' % self.orgid
+
+    def credentials(self, client_id = None, client_secret = None):
+        'Returns (client_id, client_secret), preferring any given explicitly.'
+        if client_id is None:
+            client_id = self.client_id
+        if client_secret is None:
+            client_secret = self.client_secret
+        return client_id, client_secret
+
+    def store_credentials(self, client_id, client_secret):
+        """Saves credentials to keyring under 'Addigy-<orgid>'.
+
+        Args:
+            client_id (str): The organization's API client id.
+            client_secret (str): The organization's API client secret.
+        """
+        keyring.set_password(self.service, 'ClientID', client_id)
+        keyring.set_password(self.service, 'ClientSecret', client_secret)
+        self.client_id, self.client_secret = client_id, client_secret
+
+    def endpoint(self, endpoint_class, *args, **kwargs):
+        """Creates an endpoint bound to this organization.
+
+        Args:
+            endpoint_class (type): An :mod:`endpoint` class, e.g.
+                `endpoint.Alerts` or `endpoint.FileUpload`.
+            *args, **kwargs: Passed to the class's __init__.
+        Returns:
+            Instance of `endpoint_class` using this organization's
+            credentials, session and rate limiter.
+        """
+        instance = endpoint_class.__new__(endpoint_class)
+        instance.organization = self
+        instance.__init__(*args, **kwargs)
+        return instance
+
+    def validate(self):
+        'Returns True if the organization\'s credentials authenticate.'
+        return self.endpoint(endpoint.Validate).post()
+
+class MultiOrg(object):
+    'Run endpoint calls across many organizations concurrently.'
+
+    def __init__(self, organizations, concurrency = 8):
+        """Initializes the client.
+
+        Args:
+            organizations (list): :class:`Organization` objects, or orgids
+                (str) whose credentials are stored in keyring.
+            concurrency (int): Organizations called at the same time.
+        """
+        self.organizations = [org if isinstance(org, Organization) \
+            else Organization(org) for org in organizations]
+        self.concurrency = concurrency
+        self.failures = {}
+
+    def fan_out(self, endpoint_class, method = 'get', *args, **kwargs):
+        """Calls an endpoint method in every organization concurrently.
+
+        Results are yielded as soon as each organization answers. An exception
+        raised for one organization is yielded as its error and recorded in
+        `failures`; the remaining organizations are unaffected.
+
+        Args:
+            endpoint_class (type): An :mod:`endpoint` class, e.g.
+                `endpoint.Devices`.
+            method (str): Name of the method to call. (Default is 'get')
+            *args, **kwargs: Passed to the method.
+        Returns:
+            Generator of (orgid, result, error) tuples. `error` is None on
+            success and `result` is None on failure.
+        Example:
+            for orgid, alerts, error in multi.fan_out(endpoint.Alerts, 'get',
+                    status = 'Unattended'):
+                ...
+        """
+        def call(organization):
+            try:
+                instance = organization.endpoint(endpoint_class)
+                return organization.orgid, \
+                    getattr(instance, method)(*args, **kwargs), None
+            except Exception as error:
+                return organization.orgid, None, error
+
+        if not self.organizations:
+            return
+        pool = ThreadPool(min(self.concurrency, len(self.organizations)))
+        try:
+            for orgid, result, error in pool.imap_unordered(call, \
+                    self.organizations):
+                if error is None:
+                    self.failures.pop(orgid, None)
+                else:
+                    self.failures[orgid] = error
+                yield orgid, result, error
+        finally:
+            pool.terminate()
+
+    def collect(self, endpoint_class, method = 'get', *args, **kwargs):
+        """Calls an endpoint method in every organization and waits for all.
+
+        Returns:
+            Python dictionary of orgid to result, for organizations that
+            succeeded. Failures are recorded in `failures`.
+        """
+        return dict((orgid, result) for orgid, result, error \
+            in self.fan_out(endpoint_class, method, *args, **kwargs) \
+            if error is None)
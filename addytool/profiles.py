@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`profiles` is a module of addytool used to look up many profiles at once.
+
+    :class:`ProfileStore` fetches the full `api/profiles` list once and indexes
+    it by instruction id and by payload identifier, so individual lookups are
+    served locally instead of refetching the list. Bulk deletes run
+    concurrently and keep the local index consistent with the server.
+    """
+
+import endpoint, threading
+from multiprocessing.pool import ThreadPool
+
+INSTRUCTION_KEYS = ('instruction_id', 'instructionId', 'instructionid')
+PAYLOAD_KEYS = ('payload_identifier', 'PayloadIdentifier')
+
+def instruction_id(profile):
+    'Returns the instruction id of a profile, or None.'
+    for key in INSTRUCTION_KEYS:
+        if profile.get(key) is not None:
+            return profile[key]
+    return None
+
+def payload_identifiers(profile):
+    'Returns the payload identifiers of a profile.'
+    identifiers = []
+    for payload in profile.get('payloads') or []:
+        if not isinstance(payload, dict):
+            continue
+        for key in PAYLOAD_KEYS:
+            if payload.get(key) is not None:
+                identifiers.append(payload[key])
+                break
+    return identifiers
+
+class ProfileStore(object):
+    'Local index of the organization\'s profiles.'
+
+    def __init__(self, profiles = None, concurrency = 8):
+        """Initializes an empty store. The profile list is fetched on first use.
+
+        Args:
+            profiles (endpoint.Profiles): Optionally, the endpoint to use. A
+                new `Profiles` is created by default.
+            concurrency (int): Deletes run at the same time by `delete_many`.
+        """
+        if profiles is None:
+            profiles = endpoint.Profiles()
+        self.profiles = profiles
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.by_instruction = None
+        self.by_payload = {}
+
+    def refresh(self):
+        """Fetches the full profile list once and rebuilds the indexes.
+
+        Returns:
+            Number of profiles indexed (int).
+        """
+        listed = self.profiles.get()
+        by_instruction, by_payload = {}, {}
+        for profile in listed or []:
+            profile_id = instruction_id(profile)
+            if profile_id is None:
+                continue
+            by_instruction[profile_id] = profile
+            for identifier in payload_identifiers(profile):
+                by_payload.setdefault(identifier, set()).add(profile_id)
+        with self.lock:
+            self.by_instruction, self.by_payload = by_instruction, by_payload
+        return len(by_instruction)
+
+    def _loaded(self):
+        if self.by_instruction is None:
+            self.refresh()
+        return self.by_instruction
+
+    def __len__(self):
+        return len(self._loaded())
+
+    def __contains__(self, profile_id):
+        return profile_id in self._loaded()
+
+    def __iter__(self):
+        return iter(list(self._loaded().values()))
+
+    def get(self, profile_id):
+        """Returns a profile by instruction id, without a request.
+
+        Args:
+            profile_id (str): The profile's instruction id.
+        Returns:
+            The profile (dict), or None if it is not in the store.
+        """
+        return self._loaded().get(profile_id)
+
+    def get_many(self, profile_ids):
+        """Returns many profiles by instruction id, without requests.
+
+        Args:
+            profile_ids (list of str): Instruction ids.
+        Returns:
+            Python dictionary of instruction id to profile, for the ids found.
+        """
+        profiles = self._loaded()
+        return dict((profile_id, profiles[profile_id]) for profile_id \
+            in profile_ids if profile_id in profiles)
+
+    def find_payload(self, identifier):
+        """Returns the profiles containing a payload.
+
+        Args:
+            identifier (str): A payload identifier, e.g. 'com.example.wifi'.
+        Returns:
+            Python list of profiles.
+        """
+        profiles = self._loaded()
+        with self.lock:
+            profile_ids = list(self.by_payload.get(identifier, ()))
+        return [profiles[profile_id] for profile_id in profile_ids \
+            if profile_id in profiles]
+
+    def delete(self, profile_id):
+        """Deletes a profile with `Profiles.delete` and drops it from the store.
+
+        The profile is dropped when the server answers 'ok' or 'Instruction
+        not found', since it no longer exists on the server either way.
+
+        Args:
+            profile_id (str): The profile's instruction id.
+        Returns:
+            'ok' or 'Instruction not found'
+        """
+        result = self.profiles.delete(profile_id)
+        if result in ('ok', 'Instruction not found'):
+            self._forget(profile_id)
+        return result
+
+    def delete_many(self, profile_ids):
+        """Deletes many profiles concurrently.
+
+        Args:
+            profile_ids (list of str): Instruction ids to delete.
+        Returns:
+            Python dictionary of instruction id to the result of `delete`, or
+            to the exception raised for that id.
+        """
+        self._loaded()
+
+        def delete(profile_id):
+            try:
+                return profile_id, self.delete(profile_id)
+            except Exception as error:
+                return profile_id, error
+
+        profile_ids = list(profile_ids)
+        if not profile_ids:
+            return {}
+        pool = ThreadPool(min(self.concurrency, len(profile_ids)))
+        try:
+            return dict(pool.map(delete, profile_ids))
+        finally:
+            pool.close()
+            pool.join()
+
+    def _forget(self, profile_id):
+        'Removes a profile from the indexes.'
+        with self.lock:
+            if self.by_instruction is None:
+                return
+            profile = self.by_instruction.pop(profile_id, None)
+            if profile is None:
+                return
+            for identifier in payload_identifiers(profile):
+                profile_ids = self.by_payload.get(identifier)
+                if profile_ids is not None:
+                    profile_ids.discard(profile_id)
+                    if not profile_ids:
+                        del self.by_payload[identifier]
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`snapshot` is a module of addytool used to track device inventory over time.
+
+    Each snapshot of `api/devices` is stored in a local SQLite file with one row
+    per device holding a digest of its facts. The facts themselves are stored
+    once per digest, so a device whose facts did not change since an earlier
+    snapshot adds no facts to the store. Comparing two snapshots joins the
+    digests inside SQLite and only decodes the facts of devices whose digest
+    changed, so the cost of a diff follows the number of changed devices rather
+    than the number of facts.
+    """
+
+import endpoint, sqlite3, threading, hashlib, json, time
+
+class SnapshotStore(object):
+    'Persist `Devices.get()` snapshots and compute deltas between them.'
+
+    def __init__(self, path = 'addytool-snapshots.sqlite'):
+        """Opens (or creates) the snapshot store at `path`.
+
+        Args:
+            path (str): Location of the SQLite file. ':memory:' may be used for
+                a throwaway store.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created REAL NOT NULL,
+            devices INTEGER NOT NULL)""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS facts (
+            digest TEXT PRIMARY KEY,
+            facts TEXT NOT NULL) WITHOUT ROWID""")
+        if 'facts' in self._columns('devices'):
+            self._migrate()
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS devices (
+            snapshot INTEGER NOT NULL,
+            agentid TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            PRIMARY KEY (snapshot, agentid)) WITHOUT ROWID""")
+        self.connection.execute('CREATE INDEX IF NOT EXISTS devices_digest \
+            ON devices (digest)')
+        self.connection.commit()
+
+    def _columns(self, table):
+        'Returns the column names of a table, empty if it does not exist.'
+        return [row[1] for row in self.connection.execute( \
+            'PRAGMA table_info(%s)' % table)]
+
+    def _migrate(self):
+        'Moves facts stored per device by earlier versions to `facts`.'
+        self.connection.execute('INSERT OR IGNORE INTO facts (digest, facts) \
+            SELECT digest, facts FROM devices')
+        self.connection.execute('ALTER TABLE devices RENAME TO devices_old')
+        self.connection.execute("""CREATE TABLE devices (
+            snapshot INTEGER NOT NULL,
+            agentid TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            PRIMARY KEY (snapshot, agentid)) WITHOUT ROWID""")
+        self.connection.execute('INSERT INTO devices (snapshot, agentid, \
+            digest) SELECT snapshot, agentid, digest FROM devices_old')
+        self.connection.execute('DROP TABLE devices_old')
+
+    def take(self, name = None):
+        """Fetches `api/devices` and saves it as a snapshot.
+
+        Args:
+            name (str): Optionally, the snapshot name. Defaults to the current
+                UTC time, e.g. '2019-02-23T15:02:11.042Z'.
+        Returns:
+            The snapshot name (str).
+        """
+        return self.save(endpoint.Devices().get(), name = name)
+
+    def save(self, devices, name = None, key = 'agentid'):
+        """Saves a list of device fact dictionaries as a snapshot.
+
+        Args:
+            devices (list of dict): Device facts, as returned by `Devices.get`.
+            name (str): Optionally, the snapshot name. Defaults to the current
+                UTC time with milliseconds, plus a '-2', '-3', etc. suffix if
+                that name is already taken.
+            key (str): Fact used to identify devices.
+        Returns:
+            The snapshot name (str).
+        """
+        rows = []
+        for facts in devices:
+            agentid = facts.get(key)
+            if agentid is None:
+                continue
+            encoded = json.dumps(facts, sort_keys = True, separators = (',', ':'))
+            digest = hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+            rows.append((agentid, digest, encoded))
+
+        with self.lock:
+            created = time.time()
+            if name is None:
+                name = self._default_name(created)
+            cursor = self.connection.execute('INSERT INTO snapshots (name, \
+                created, devices) VALUES (?, ?, ?)', (name, created, len(rows)))
+            snapshot_id = cursor.lastrowid
+            self.connection.executemany('INSERT OR IGNORE INTO facts \
+                (digest, facts) VALUES (?, ?)',
+                ((digest, encoded) for agentid, digest, encoded in rows))
+            self.connection.executemany('INSERT OR REPLACE INTO devices \
+                (snapshot, agentid, digest) VALUES (?, ?, ?)',
+                ((snapshot_id, agentid, digest) \
+                    for agentid, digest, encoded in rows))
+            self.connection.commit()
+        return name
+
+    def _default_name(self, created):
+        'Returns an unused name from the time `created`. Hold `lock`.'
+        base = '%s.%03dZ' % (time.strftime('%Y-%m-%dT%H:%M:%S', \
+            time.gmtime(created)), int(created * 1000) % 1000)
+        name, suffix = base, 1
+        while self.connection.execute('SELECT 1 FROM snapshots WHERE name = ?', \
+                (name,)).fetchone() is not None:
+            suffix += 1
+            name = '%s-%d' % (base, suffix)
+        return name
+
+    def names(self):
+        'Returns snapshot names, oldest first.'
+        with self.lock:
+            rows = self.connection.execute('SELECT name FROM snapshots \
+                ORDER BY id').fetchall()
+        return [row[0] for row in rows]
+
+    def load(self, name):
+        """Loads a snapshot.
+
+        Args:
+            name (str): The snapshot name.
+        Returns:
+            Python dictionary of agentid to fact dictionary.
+        """
+        snapshot_id = self._id(name)
+        with self.lock:
+            rows = self.connection.execute('SELECT d.agentid, f.facts FROM \
+                devices d JOIN facts f ON f.digest = d.digest WHERE \
+                d.snapshot = ?', (snapshot_id,)).fetchall()
+        return dict((agentid, json.loads(facts)) for agentid, facts in rows)
+
+    def delete(self, name):
+        'Deletes a snapshot, and the facts no other snapshot refers to.'
+        snapshot_id = self._id(name)
+        with self.lock:
+            self.connection.execute('DELETE FROM devices WHERE snapshot = ?',
+                (snapshot_id,))
+            self.connection.execute('DELETE FROM snapshots WHERE id = ?',
+                (snapshot_id,))
+            self.connection.execute('DELETE FROM facts WHERE NOT EXISTS \
+                (SELECT 1 FROM devices WHERE devices.digest = facts.digest)')
+            self.connection.commit()
+
+    def diff(self, old, new):
+        """Computes the per-device, per-fact delta between two snapshots.
+
+        Args:
+            old (str): Name of the earlier snapshot.
+            new (str): Name of the later snapshot.
+        Returns:
+            Python dictionary:
+                "added" (dict): agentid to facts of devices only in `new`.
+                "removed" (dict): agentid to facts of devices only in `old`.
+                "changed" (dict): agentid to a dictionary of changed facts,
+                    each mapped to an [old value, new value] list. Facts
+                    missing from one side are reported as None.
+        """
+        old_id, new_id = self._id(old), self._id(new)
+        with self.lock:
+            changed = self.connection.execute('SELECT a.agentid, fa.facts, \
+                fb.facts FROM devices a JOIN devices b ON b.snapshot = ? AND \
+                b.agentid = a.agentid JOIN facts fa ON fa.digest = a.digest \
+                JOIN facts fb ON fb.digest = b.digest WHERE a.snapshot = ? \
+                AND a.digest != b.digest', (new_id, old_id)).fetchall()
+            added = self._missing(new_id, old_id)
+            removed = self._missing(old_id, new_id)
+
+        delta = {
+            'added': dict((agentid, json.loads(facts)) for agentid, facts in added),
+            'removed': dict((agentid, json.loads(facts)) for agentid, facts in removed),
+            'changed': {},
+            }
+        for agentid, old_facts, new_facts in changed:
+            delta['changed'][agentid] = diff_facts(json.loads(old_facts),
+                json.loads(new_facts))
+        return delta
+
+    def _missing(self, snapshot_id, other_id):
+        'Returns (agentid, facts) rows in one snapshot but not the other.'
+        return self.connection.execute('SELECT a.agentid, f.facts FROM \
+            devices a JOIN facts f ON f.digest = a.digest LEFT JOIN devices b \
+            ON b.snapshot = ? AND b.agentid = a.agentid WHERE a.snapshot = ? \
+            AND b.agentid IS NULL', (other_id, snapshot_id)).fetchall()
+
+    def _id(self, name):
+        'Returns the row id of a snapshot, raising KeyError if unknown.'
+        with self.lock:
+            row = self.connection.execute('SELECT id FROM snapshots WHERE \
+                name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def close(self):
+        'Closes the snapshot store.'
+        with self.lock:
+            self.connection.close()
+
+def diff_facts(old, new):
+    """Returns the facts that differ between two fact dictionaries.
+
+    Args:
+        old (dict): Earlier facts of a device.
+        new (dict): Later facts of the same device.
+    Returns:
+        Python dictionary of fact name to [old value, new value].
+    """
+    delta = {}
+    for fact in set(old).union(new):
+        before, after = old.get(fact), new.get(fact)
+        if before != after:
+            delta[fact] = [before, after]
+    return delta
@@ -0,0 +1,236 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`tracing` is a module of addytool used to find where workflows spend time.
+
+    A :class:`Tracer` records nested spans around workflow steps, endpoint
+    calls, HTTP attempts, keyring lookups and JSON decoding. Each span records
+    wall time, CPU time and, optionally, the change in memory allocated
+    according to :mod:`tracemalloc`. A :mod:`cProfile` capture of the whole
+    session can be enabled as well. Spans are written in the Chrome trace
+    event format, which chrome://tracing, Perfetto and speedscope load as a
+    flame graph.
+
+    Example:
+        with tracing.Tracer(allocations = True) as tracer:
+            workflow.authenticate()
+        tracer.write('authenticate.trace.json')
+    """
+
+import functools, json, os, threading, time
+
+try:
+    _cpu_time = time.thread_time
+except AttributeError:
+    _cpu_time = getattr(time, 'process_time', None) or time.clock
+
+active = None
+
+class _NullSpan(object):
+    'Context manager used when no tracer is active.'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, category = 'addytool', **args):
+    """Returns a span of the active tracer, or a no-op context manager.
+
+    Args:
+        name (str): Name of the span, e.g. 'Devices.get'.
+        category (str): Category shown in the trace viewer.
+        **args: Extra values attached to the span.
+    """
+    tracer = active
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, category, **args)
+
+def traced(name = None, category = 'workflow'):
+    """Decorator wrapping every call of a function in a span.
+
+    Args:
+        name (str): Optionally, the span name. Defaults to
+            '<module>.<function>'.
+        category (str): Category shown in the trace viewer.
+    """
+    def decorate(function):
+        span_name = name or '%s.%s' % (function.__module__, function.__name__)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return function(*args, **kwargs)
+            with active.span(span_name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class Span(object):
+    'A timed region of a trace. Use through `Tracer.span`.'
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.memory = self.tracer.allocated()
+        self.cpu = _cpu_time()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.time()
+        cpu = _cpu_time() - self.cpu
+        stack = self.tracer.stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        args = dict(self.args)
+        args['cpu_ms'] = round(cpu * 1000, 3)
+        if self.parent is not None:
+            args['parent'] = self.parent
+        if self.memory is not None:
+            args['alloc_bytes'] = self.tracer.allocated() - self.memory
+        if exc_type is not None:
+            args['error'] = exc_type.__name__
+        self.tracer.record({
+            'name': self.name,
+            'cat': self.category,
+            'ph': 'X',
+            'ts': (self.start - self.tracer.origin) * 1e6,
+            'dur': (end - self.start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.current_thread().ident,
+            'args': args,
+            })
+        return False
+
+class Tracer(object):
+    """Collect spans from workflows and the shared request path.
+
+    While installed, the tracer is the module's `active` tracer and a request
+    hook (see :func:`endpoint.add_hook`), so every HTTP attempt is traced.
+    """
+
+    def __init__(self, allocations = False, profile = False):
+        """Initializes the tracer. Nothing is recorded until `install`.
+
+        Args:
+            allocations (bool): Record allocation deltas with tracemalloc.
+                (Default is False, since tracemalloc slows Python down)
+            profile (bool): Capture a cProfile profile while installed.
+        """
+        self.allocations = allocations
+        self.profiler = None
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.time()
+        self.started_tracemalloc = False
+
+    def stack(self):
+        'Returns the open spans of the current thread.'
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def allocated(self):
+        'Returns bytes currently traced by tracemalloc, or None.'
+        if not self.allocations:
+            return None
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[0]
+
+    def record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def span(self, name, category = 'addytool', **args):
+        """Returns a context manager timing a span.
+
+        Args:
+            name (str): Name of the span.
+            category (str): Category shown in the trace viewer.
+            **args: Extra values attached to the span.
+        """
+        return Span(self, name, category, args)
+
+    def before_request(self, context):
+        'Opens a span for an HTTP attempt.'
+        name = '%s %s' % (context['endpoint'], context['method'])
+        context['span'] = self.span(name, 'http', url = context['url'], \
+            attempt = context['attempt']).__enter__()
+
+    def after_request(self, context):
+        'Closes the span opened by `before_request`.'
+        span = context.pop('span', None)
+        if span is None:
+            return
+        response = context.get('response')
+        if response is not None:
+            span.args['status'] = response.status_code
+        span.args['response_bytes'] = context.get('response_bytes')
+        error = context.get('error')
+        span.__exit__(type(error) if error is not None else None, error, None)
+
+    def install(self):
+        'Starts tracing.'
+        global active
+        import endpoint
+        if self.allocations:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracemalloc = True
+        active = self
+        endpoint.add_hook(self)
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def uninstall(self):
+        'Stops tracing.'
+        global active
+        import endpoint
+        if self.profiler is not None:
+            self.profiler.disable()
+        endpoint.remove_hook(self)
+        if active is self:
+            active = None
+        if self.started_tracemalloc:
+            import tracemalloc
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def write(self, path):
+        """Writes the spans as a Chrome trace file. When profiling, the cProfile
+        statistics are also written to `path` + '.prof', for pstats or
+        snakeviz.
+
+        Args:
+            path (str): Destination file, e.g. 'workflow.trace.json'.
+        """
+        with self.lock:
+            events = sorted(self.events, key = lambda event: event['ts'])
+        with open(path, 'w') as output:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output)
+        if self.profiler is not None:
+            self.profiler.dump_stats(path + '.prof')
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`transport` is a module of addytool used to record and replay API traffic.
+
+    :class:`Recorder` captures every request/response pair sent through
+    :func:`endpoint.send` (all endpoint classes, `FileUpload` and `Validate`)
+    to a gzipped JSON-lines cassette, with the client-id and client-secret
+    headers scrubbed. :class:`Replayer` serves a cassette back without the
+    network, at the recorded latency or at zero latency, so client-side cost
+    such as JSON parsing can be profiled separately from network time.
+
+    Example:
+        with transport.Recorder('nightly.cassette.gz'):
+            run_nightly_job()
+        with transport.Replayer('nightly.cassette.gz', latency = 'zero'):
+            run_nightly_job()
+    """
+
+import endpoint, base64, collections, gzip, hashlib, json, threading, time
+
+SCRUBBED_HEADERS = ('client-id', 'client-secret')
+
+def _key(method, url, params = None, data = None, json_data = None):
+    """Returns the key used to match a request to a recorded interaction.
+
+    The method, URL, query parameters and body are included; uploaded files
+    are not, since upload URLs are already unique.
+    """
+    body = json.dumps([params, data, json_data], sort_keys = True, default = str)
+    return '%s %s %s' % (method.upper(), url, \
+        hashlib.sha1(body.encode('utf-8')).hexdigest())
+
+class Recorder(object):
+    'Record request/response pairs sent through :func:`endpoint.send`.'
+
+    def __init__(self, path):
+        """Opens a new cassette for writing.
+
+        Args:
+            path (str): Cassette file to create; overwritten if it exists.
+        """
+        self.path = path
+        self.output = gzip.open(path, 'wb')
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def request(self, session, method, url, headers = None, params = None, \
+            data = None, json = None, **kwargs):
+        'Sends the request with `session` and records the interaction.'
+        start = time.time()
+        response = session.request(method, url, headers = headers, \
+            params = params, data = data, json = json, **kwargs)
+        content = response.content or b''
+        elapsed = time.time() - start
+        try:
+            body, encoding = content.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(content).decode('ascii'), 'base64'
+        interaction = {
+            'key': _key(method, url, params, data, json),
+            'method': method.upper(),
+            'url': url,
+            'request_headers': scrub(headers),
+            'status': response.status_code,
+            'headers': dict(response.headers),
+            'body': body,
+            'encoding': encoding,
+            'elapsed': elapsed,
+            }
+        line = _dumps(interaction) + '\n'
+        with self.lock:
+            self.output.write(line.encode('utf-8'))
+            self.count += 1
+        return response
+
+    def install(self):
+        'Routes all requests through this recorder.'
+        endpoint.transport = self
+        return self
+
+    def uninstall(self):
+        'Stops recording and closes the cassette.'
+        if endpoint.transport is self:
+            endpoint.transport = None
+        with self.lock:
+            if not self.output.closed:
+                self.output.close()
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+class Replayer(object):
+    """Serve recorded responses instead of sending requests.
+
+    Interactions are matched on method, URL, query parameters and body. When
+    the same request was recorded several times the responses are served in
+    recorded order, and the last one is repeated once they run out.
+    """
+
+    def __init__(self, path, latency = 'zero'):
+        """Loads a cassette.
+
+        Args:
+            path (str): Cassette file written by :class:`Recorder`.
+            latency (str): 'zero' to answer immediately, or 'recorded' to
+                sleep for each interaction's recorded duration.
+        """
+        if latency not in ('zero', 'recorded'):
+            raise ValueError("latency must be 'zero' or 'recorded'")
+        self.path = path
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.interactions = collections.defaultdict(collections.deque)
+        self.misses = 0
+        with gzip.open(path, 'rb') as cassette:
+            for line in cassette:
+                interaction = json.loads(line.decode('utf-8'))
+                self.interactions[interaction['key']].append(interaction)
+
+    def request(self, session, method, url, headers = None, params = None, \
+            data = None, json = None, **kwargs):
+        """Returns the recorded response for a request.
+
+        Raises:
+            KeyError: If the cassette has no matching interaction.
+        """
+        key = _key(method, url, params, data, json)
+        with self.lock:
+            queue = self.interactions.get(key)
+            if not queue:
+                self.misses += 1
+                raise KeyError('No recorded response for %s %s' % (method, url))
+            interaction = queue.popleft() if len(queue) > 1 else queue[0]
+        if self.latency == 'recorded':
+            time.sleep(interaction['elapsed'])
+        return ReplayedResponse(interaction)
+
+    def install(self):
+        'Routes all requests through this replayer.'
+        endpoint.transport = self
+        return self
+
+    def uninstall(self):
+        'Stops replaying.'
+        if endpoint.transport is self:
+            endpoint.transport = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+class ReplayedResponse(object):
+    'The parts of :class:`requests.Response` used by addytool.'
+
+    def __init__(self, interaction):
+        self.status_code = interaction['status']
+        self.headers = _Headers(interaction['headers'])
+        self.url = interaction['url']
+        self.elapsed = interaction['elapsed']
+        if interaction['encoding'] == 'base64':
+            self.content = base64.b64decode(interaction['body'])
+        else:
+            self.content = interaction['body'].encode('utf-8')
+        self.request = None
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size = 1, decode_unicode = False):
+        size = chunk_size or len(self.content) or 1
+        for start in range(0, len(self.content), size):
+            chunk = self.content[start:start + size]
+            yield chunk.decode('utf-8') if decode_unicode else chunk
+
+    def close(self):
+        pass
+
+class _Headers(dict):
+    'Case-insensitive header lookup.'
+
+    def __init__(self, headers):
+        dict.__init__(self, ((name.lower(), value) for name, value \
+            in headers.items()))
+
+    def get(self, name, default = None):
+        return dict.get(self, name.lower(), default)
+
+    def __getitem__(self, name):
+        return dict.__getitem__(self, name.lower())
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name.lower())
+
+def scrub(headers):
+    'Returns a copy of `headers` with credentials replaced by "REDACTED".'
+    scrubbed = {}
+    for name, value in (headers or {}).items():
+        if name.lower() in SCRUBBED_HEADERS:
+            value = 'REDACTED'
+        scrubbed[name] = value
+    return scrubbed
+
+def _dumps(interaction):
+    return json.dumps(interaction, separators = (',', ':'), default = str)
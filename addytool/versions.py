@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`versions` is a module of addytool used to parse and compare versions.
+
+    Application, OS and software versions are compared the same way
+    everywhere in addytool (filters, the catalog index and analytics), so
+    "latest" and "older than" mean the same thing in every module.
+
+    Build numbers in parentheses and trailing text are ignored, and trailing
+    zero components do not change the order, so '1.2', '1.2.0' and
+    '1.2.0 (4711)' are the same version. Pre-release tags (a, alpha, b, beta,
+    rc, dev) sort before the release, e.g. '2.0b3' < '2.0' < '2.0.1', while
+    other tags sort after it, e.g. '2.0' < '2.0p1'.
+    """
+
+import re
+
+_VERSION = re.compile(r'v?(\d+(?:\.\d+)*)(?:[ ._-]?([a-z]+)[ .]?(\d*))?', re.I)
+_TAGS = {'alpha': 'a', 'beta': 'b', 'c': 'rc', 'pre': 'rc', 'preview': 'rc'}
+_PRERELEASE = set(['a', 'b', 'rc', 'dev'])
+_STRINGS = (str, type(u''))
+_NUMBERS = (int, type(2 ** 64), float)
+_CACHE_SIZE = 100000
+_UNPARSED = ((), (-1, '', 0))
+_cache = {}
+
+def parse(version):
+    """Parses a version string, e.g. a CFBundleShortVersionString.
+
+    Args:
+        version (str): e.g. '10.15.7', '4.2.1 (12345)' or '2.0.0-beta.3'.
+            Non-negative numbers are accepted too; booleans are not.
+    Returns:
+        (key, normalized) tuple, where `key` is a sort key and `normalized` a
+        display string such as '2.0b3', or None if no version was found.
+    """
+    if isinstance(version, bool):
+        return None
+    if isinstance(version, _NUMBERS):
+        version = repr(version) if isinstance(version, float) else str(version)
+    elif not isinstance(version, _STRINGS):
+        return None
+    try:
+        return _cache[version]
+    except KeyError:
+        pass
+    parsed = _parse(version)
+    if len(_cache) >= _CACHE_SIZE:
+        _cache.clear()
+    _cache[version] = parsed
+    return parsed
+
+def _parse(version):
+    match = _VERSION.match(version.strip())
+    if match is None:
+        return None
+    release, tag, number = match.groups()
+    parts = [int(part) for part in release.split('.')]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    normalized = '.'.join(str(part) for part in parts + [0] * (2 - len(parts)))
+    if tag:
+        tag = tag.lower()
+        tag = _TAGS.get(tag, tag)
+        suffix = (0 if tag in _PRERELEASE else 2, tag, int(number or 0))
+        normalized += tag + (number or '')
+    else:
+        suffix = (1, '', 0)
+    return (tuple(parts), suffix), normalized
+
+def key(version):
+    """Returns a sort key for any value. Values that are not versions sort
+    before every version."""
+    parsed = parse(version)
+    if parsed is None:
+        return _UNPARSED
+    return parsed[0]
+
+def compare(version, other):
+    """Compares two versions.
+
+    Returns:
+        -1, 0 or 1 as `version` is older than, the same as, or newer than
+        `other`. Values that are not versions sort before every version.
+    """
+    first, second = key(version), key(other)
+    if first == second:
+        return 0
+    return -1 if first < second else 1
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`watch` is a module of addytool used to follow devices coming online.
+
+    :class:`OnlineWatcher` polls `api/devices/online`, keeps the online set
+    keyed by agentid and emits events from set differences between polls. The
+    poll interval shortens while devices are coming and going, and lengthens
+    while the online set is stable.
+    """
+
+import endpoint, threading, collections
+
+CAME_ONLINE = 'online'
+WENT_OFFLINE = 'offline'
+
+class OnlineWatcher(object):
+    """Emit came-online/went-offline events for devices.
+
+    Events are (event, agentid, facts) tuples, where event is `CAME_ONLINE` or
+    `WENT_OFFLINE` and facts is the device's most recent fact dictionary.
+    Events can be consumed with callbacks (`on_change` and `run`), by
+    iterating over the watcher, or with `async for` on Python 3.
+    """
+
+    def __init__(self, devices_online = None, interval = 30, \
+            min_interval = 5, max_interval = 300, emit_initial = False, \
+            key = 'agentid'):
+        """Initializes the watcher. No request is made until the first poll.
+
+        Args:
+            devices_online (endpoint.DevicesOnline): Optionally, the endpoint
+                to poll. A new `DevicesOnline` is created by default.
+            interval (float): Starting poll interval in seconds.
+            min_interval (float): Shortest poll interval in seconds.
+            max_interval (float): Longest poll interval in seconds.
+            emit_initial (bool): Whether devices online at the first poll
+                produce `CAME_ONLINE` events. Defaults to `False`, so the first
+                poll only establishes the baseline.
+            key (str): Fact used to identify devices.
+        """
+        if devices_online is None:
+            devices_online = endpoint.DevicesOnline()
+        self.devices_online = devices_online
+        self.interval = float(interval)
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.emit_initial = emit_initial
+        self.key = key
+        self.online = None
+        self.callbacks = []
+        self.queue = collections.deque()
+        self.stopped = threading.Event()
+
+    def on_change(self, callback):
+        """Registers a callback for events.
+
+        Args:
+            callback (callable): Called as callback(event, agentid, facts) for
+                each event, in the thread running `poll`.
+        Returns:
+            `callback`, so this can be used as a decorator.
+        """
+        self.callbacks.append(callback)
+        return callback
+
+    def poll(self):
+        """Polls `DevicesOnline` once and returns the resulting events.
+
+        Returns:
+            Python list of (event, agentid, facts) tuples.
+        Raises:
+            ValueError: If the response is not a list of devices, e.g. an
+                error response such as {"error": "..."}.
+        """
+        devices = self.devices_online.get()
+        if devices is None:
+            devices = []
+        if not isinstance(devices, list):
+            raise ValueError('DevicesOnline did not return a list: %r' % \
+                (devices,))
+        current = {}
+        for facts in devices:
+            if not isinstance(facts, dict):
+                raise ValueError('DevicesOnline returned a device that is not '
+                    'a dictionary: %r' % (facts,))
+            agentid = facts.get(self.key)
+            if agentid is not None:
+                current[agentid] = facts
+
+        if self.online is None:
+            previous = {}
+            baseline = not self.emit_initial
+        else:
+            previous = self.online
+            baseline = False
+        self.online = current
+
+        events = []
+        if not baseline:
+            for agentid in set(current).difference(previous):
+                events.append((CAME_ONLINE, agentid, current[agentid]))
+            for agentid in set(previous).difference(current):
+                events.append((WENT_OFFLINE, agentid, previous[agentid]))
+
+        self.adapt(len(events), len(current))
+        for event in events:
+            for callback in self.callbacks:
+                callback(*event)
+        return events
+
+    def adapt(self, changes, total):
+        """Adjusts the poll interval to the rate of change of the online set.
+
+        The interval halves when more than 1% of the online set changed (or
+        any device, for small fleets), shrinks slightly for smaller changes,
+        and grows by half when nothing changed.
+
+        Args:
+            changes (int): Events produced by the last poll.
+            total (int): Devices online after the last poll.
+        """
+        if changes == 0:
+            interval = self.interval * 1.5
+        elif changes * 100 > total:
+            interval = self.interval / 2
+        else:
+            interval = self.interval * 0.8
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+
+    def run(self, polls = None):
+        """Polls until `stop` is called, dispatching events to callbacks.
+
+        Args:
+            polls (int): Optionally, stop after this many polls.
+        """
+        count = 0
+        while not self.stopped.is_set():
+            self.poll()
+            count += 1
+            if polls is not None and count >= polls:
+                break
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        'Stops `run` and any iteration at the next opportunity.'
+        self.stopped.set()
+
+    def next_event(self):
+        """Returns the next event, polling as often as needed.
+
+        Raises:
+            StopIteration: After `stop` has been called.
+        """
+        while not self.queue:
+            if self.stopped.is_set():
+                raise StopIteration
+            if self.online is not None:
+                self.stopped.wait(self.interval)
+                if self.stopped.is_set():
+                    raise StopIteration
+            self.queue.extend(self.poll())
+        return self.queue.popleft()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next_event()
+
+    next = __next__
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        """Returns an awaitable for the next event (Python 3 only).
+
+        Polling runs in the event loop's default executor, so waiting between
+        polls does not block the loop.
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(None, self._next_event_async)
+
+    def _next_event_async(self):
+        'Translates the end of iteration for `async for`.'
+        try:
+            return self.next_event()
+        except StopIteration:
+            raise StopAsyncIteration
@@ -5,8 +5,10 @@
 
     """
 
-import endpoint, keyring, getpass
+import endpoint, filters, tracing, keyring, getpass
+from multiprocessing.pool import ThreadPool
 
+@tracing.traced()
 def authenticate():
     """"Validates token or provides two opportunities to update
     Keychain credentials in the case of a failed authentication.
@@ -30,3 +32,189 @@ def authenticate():
                 print('Authentication failed.')
 
         return False
+
+@tracing.traced()
+def bulk_command(agent_ids, command, journal = None, job = None, \
+        chunk_size = 100, concurrency = 1):
+    """Runs a command on many devices, in chunks of `chunk_size` agent ids.
+
+    Args:
+        agent_ids (list of str): Agent ids of the devices to run `command` on.
+        command (str): The command to be sent to the devices.
+        journal (journal.Journal): Optionally, a journal used to skip chunks
+            already sent by a previous, interrupted run of the same job.
+        job (str): Optionally, the journal job name. Defaults to 'command'.
+        chunk_size (int): Agent ids sent per request.
+        concurrency (int): Requests made at the same time.
+    Returns:
+        Python list of `DevicesCommands.post` results for chunks sent in
+        this run.
+    """
+    commands = endpoint.DevicesCommands()
+    chunks = [[agent_ids[i:i + chunk_size], command] \
+        for i in range(0, len(agent_ids), chunk_size)]
+    return _bulk(commands.post, chunks, journal, job or 'command', concurrency)
+
+@tracing.traced()
+def bulk_assign_policy(policy_id, agent_ids, journal = None, job = None, \
+        concurrency = 1):
+    """Assigns many devices to a policy.
+
+    Args:
+        policy_id (str): The policy id to which the devices will be assigned.
+        agent_ids (list of str): Agent ids of the devices to assign.
+        journal (journal.Journal): Optionally, a journal used to skip devices
+            already assigned by a previous run of the same job.
+        job (str): Optionally, the journal job name. Defaults to
+            'policy-devices'.
+        concurrency (int): Requests made at the same time.
+    Returns:
+        Python list of `PoliciesDevices.post` results for calls made in this
+        run.
+    """
+    policies_devices = endpoint.PoliciesDevices()
+    calls = [[policy_id, agent_id] for agent_id in agent_ids]
+    return _bulk(policies_devices.post, calls, journal, job or 'policy-devices', \
+        concurrency)
+
+@tracing.traced()
+def bulk_add_instructions(policy_id, instruction_ids, journal = None, \
+        job = None, concurrency = 1):
+    """Adds many instructions to a policy.
+
+    Args:
+        policy_id (str): The policy id to which the instructions will be added.
+        instruction_ids (list of str): Instruction ids to add.
+        journal (journal.Journal): Optionally, a journal used to skip
+            instructions already added by a previous run of the same job.
+        job (str): Optionally, the journal job name. Defaults to
+            'policy-instructions'.
+        concurrency (int): Requests made at the same time.
+    Returns:
+        Python list of `PoliciesInstructions.post` results for calls made in
+        this run.
+    """
+    policies_instructions = endpoint.PoliciesInstructions()
+    calls = [[policy_id, instruction_id] for instruction_id in instruction_ids]
+    return _bulk(policies_instructions.post, calls, journal, \
+        job or 'policy-instructions', concurrency)
+
+@tracing.traced()
+def select_devices(expression, devices = None):
+    """Returns the agentids of devices matching a filter expression.
+
+    Args:
+        expression (str): A filter expression, e.g.
+            '"OS Version" < "14.0" and "Battery Percentage" < 20'.
+            See :mod:`filters` for the syntax.
+        devices: Optionally, the inventory to filter: a `filters.Columns`
+            index, a dict of agentid to facts, or a list of fact dictionaries.
+            Defaults to the output of `Devices.get()`.
+    Returns:
+        Python list of agentids (str).
+    """
+    if devices is None:
+        devices = endpoint.Devices().get()
+    return filters.compile(expression).select(devices)
+
+@tracing.traced()
+def command_where(expression, command, devices = None, journal = None, \
+        job = None):
+    """Runs a command on every device matching a filter expression.
+
+    Args:
+        expression (str): A filter expression. See :mod:`filters`.
+        command (str): The command to be sent to the devices.
+        devices: Optionally, the inventory to filter. See `select_devices`.
+        journal (journal.Journal): Optionally, a journal. See `bulk_command`.
+        job (str): Optionally, the journal job name.
+    Returns:
+        Python list of `DevicesCommands.post` results.
+    """
+    return bulk_command(select_devices(expression, devices), command, \
+        journal = journal, job = job)
+
+@tracing.traced()
+def assign_policy_where(expression, policy_id, devices = None, \
+        journal = None, job = None):
+    """Assigns every device matching a filter expression to a policy.
+
+    Args:
+        expression (str): A filter expression. See :mod:`filters`.
+        policy_id (str): The policy id to which the devices will be assigned.
+        devices: Optionally, the inventory to filter. See `select_devices`.
+        journal (journal.Journal): Optionally, a journal. See
+            `bulk_assign_policy`.
+        job (str): Optionally, the journal job name.
+    Returns:
+        Python list of `PoliciesDevices.post` results.
+    """
+    return bulk_assign_policy(policy_id, select_devices(expression, devices), \
+        journal = journal, job = job)
+
+def paginate(get, per_page = 100, **kwargs):
+    """Yields every item of a paginated endpoint, one page at a time.
+
+    Args:
+        get (bound method): A paginated GET method, e.g. `Alerts().get` or
+            `Maintenance().get`.
+        per_page (int): Objects requested per page. The maximum is 100.
+        **kwargs: Passed to `get`, e.g. status = 'Unattended'.
+    Returns:
+        Generator of items. Only one page is held in memory at a time.
+    Raises:
+        ValueError: If a page is not a list, e.g. an error response such as
+            {"error": "..."}.
+    """
+    page = 1
+    while True:
+        items = get(per_page = per_page, page = page, **kwargs)
+        if not isinstance(items, list):
+            raise ValueError('Page %d is not a list: %r' % (page, items))
+        if not items:
+            return
+        for item in items:
+            yield item
+        if len(items) < per_page:
+            return
+        page += 1
+
+def bulk(method, calls, journal = None, job = 'default', concurrency = 1):
+    """Calls `method` once per argument list, yielding results as they arrive.
+
+    Args:
+        method (bound method): Endpoint method to call, e.g.
+            `endpoint.PoliciesDevices().post`.
+        calls (list of list): Positional arguments for each call.
+        journal (journal.Journal): Optionally, a journal used to skip calls
+            completed by a previous run of the same job.
+        job (str): The journal job name.
+        concurrency (int): Calls made at the same time. Results are still
+            yielded in the order of `calls`.
+    Returns:
+        Generator of (arguments, result) tuples.
+    """
+    calls = [list(arguments) for arguments in calls]
+    if journal is not None:
+        calls = journal.remaining(job, method, calls)
+
+    def call(arguments):
+        if journal is None:
+            return arguments, method(*arguments)
+        return arguments, journal.call(job, method, *arguments)
+
+    if concurrency <= 1 or len(calls) <= 1:
+        for arguments in calls:
+            yield call(arguments)
+        return
+    pool = ThreadPool(min(concurrency, len(calls)))
+    try:
+        for item in pool.imap(call, calls):
+            yield item
+    finally:
+        pool.terminate()
+
+def _bulk(method, calls, journal, job, concurrency = 1):
+    'Returns the results of `bulk` as a list.'
+    return [result for arguments, result \
+        in bulk(method, calls, journal, job, concurrency)]
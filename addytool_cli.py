@@ -0,0 +1,304 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`addytool_cli` is the `addytool` command-line interface.
+
+    Subcommands wrap the endpoint classes and print results as JSON lines,
+    one object per line, flushed as each result arrives:
+
+        addytool devices --where '"OS Version" < "14.0"'
+        addytool alerts --status Unattended --page-size 100
+        addytool commands run 'softwareupdate -l' \\
+            --where '"FileVault Enabled" == false' --concurrency 4 \\
+            --journal updates.sqlite
+
+    Importing the `addytool` package validates credentials, and may prompt
+    for them, so this module lives outside the package and only imports the
+    modules a subcommand needs once that subcommand runs. Credentials are read
+    from the keychain; `addytool auth` validates or updates them.
+    """
+
+import argparse, json, os, sys
+
+PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'addytool')
+
+def _modules(*names):
+    'Imports addytool modules without running the package `__init__`.'
+    if PACKAGE not in sys.path:
+        sys.path.insert(0, PACKAGE)
+    return [__import__(name) for name in names]
+
+def _emit(item):
+    'Writes one JSON line to stdout and flushes it.'
+    sys.stdout.write(json.dumps(item, separators = (',', ':'), \
+        default = str) + '\n')
+    sys.stdout.flush()
+
+def _emit_all(items):
+    'Writes every item of an iterable and returns the number written.'
+    count = 0
+    for item in items:
+        _emit(item)
+        count += 1
+    return count
+
+def _emit_bulk(results):
+    'Writes (arguments, result) tuples from `workflow.bulk`.'
+    for arguments, result in results:
+        _emit({'arguments': arguments, 'result': result})
+
+def _journal(args):
+    'Returns a `journal.Journal` if --journal was given, else None.'
+    if not args.journal:
+        return None
+    journal, = _modules('journal')
+    return journal.Journal(args.journal)
+
+def _devices(args):
+    'Yields device facts, filtered by --where and --online.'
+    endpoint, = _modules('endpoint')
+    if getattr(args, 'online', False):
+        devices = endpoint.DevicesOnline().get()
+    else:
+        devices = endpoint.Devices().stream()
+    match = getattr(args, 'where', None)
+    if not match:
+        return devices
+    return (facts for facts in devices if match(facts))
+
+def auth(args):
+    workflow, = _modules('workflow')
+    authenticated = workflow.authenticate()
+    _emit({'authenticated': authenticated})
+    return 0 if authenticated else 1
+
+def devices(args):
+    _emit_all(_devices(args))
+
+def apps(args):
+    endpoint, = _modules('endpoint')
+    for device in endpoint.Applications().stream():
+        if not args.flat:
+            _emit(device)
+            continue
+        agentid = device.get('agentid')
+        for application in device.get('installed_applications') or []:
+            row = {'agentid': agentid}
+            row.update(application)
+            _emit(row)
+
+def alerts(args):
+    endpoint, workflow = _modules('endpoint', 'workflow')
+    kwargs = {}
+    if args.status is not None:
+        kwargs['status'] = args.status
+    _emit_all(workflow.paginate(endpoint.Alerts().get, \
+        per_page = args.page_size, **kwargs))
+
+def maintenance(args):
+    endpoint, workflow = _modules('endpoint', 'workflow')
+    _emit_all(workflow.paginate(endpoint.Maintenance().get, \
+        per_page = args.page_size))
+
+def policies_list(args):
+    endpoint, = _modules('endpoint')
+    _emit_all(endpoint.Policies().get())
+
+def policies_create(args):
+    endpoint, = _modules('endpoint')
+    kwargs = {'name': args.name, 'parent_id': args.parent}
+    if args.icon is not None:
+        kwargs['icon'] = args.icon
+    if args.color is not None:
+        kwargs['color'] = args.color
+    _emit(endpoint.Policies().post(**kwargs))
+
+def policies_devices(args):
+    endpoint, = _modules('endpoint')
+    _emit_all(endpoint.PoliciesDevices().get(args.policy_id))
+
+def policies_assign(args):
+    endpoint, workflow = _modules('endpoint', 'workflow')
+    agent_ids = _agent_ids(args)
+    calls = [[args.policy_id, agent_id] for agent_id in agent_ids]
+    _emit_bulk(workflow.bulk(endpoint.PoliciesDevices().post, calls, \
+        _journal(args), args.job or 'policy-devices', args.concurrency))
+
+def policies_instructions(args):
+    endpoint, = _modules('endpoint')
+    _emit_all(endpoint.PoliciesInstructions().get(args.policy_id))
+
+def policies_add_instruction(args):
+    endpoint, workflow = _modules('endpoint', 'workflow')
+    calls = [[args.policy_id, instruction_id] for instruction_id \
+        in args.instruction_ids]
+    _emit_bulk(workflow.bulk(endpoint.PoliciesInstructions().post, calls, \
+        _journal(args), args.job or 'policy-instructions', args.concurrency))
+
+def commands_run(args):
+    endpoint, workflow = _modules('endpoint', 'workflow')
+    agent_ids = _agent_ids(args)
+    size = args.page_size
+    chunks = [[agent_ids[i:i + size], args.command] \
+        for i in range(0, len(agent_ids), size)]
+    _emit_bulk(workflow.bulk(endpoint.DevicesCommands().post, chunks, \
+        _journal(args), args.job or 'command', args.concurrency))
+
+def commands_output(args):
+    endpoint, = _modules('endpoint')
+    _emit(endpoint.DevicesOutput().get(args.actionid, args.agentid))
+
+def upload(args):
+    endpoint, workflow = _modules('endpoint', 'workflow')
+
+    def post(path):
+        return json.loads(endpoint.FileUpload().post(path))
+
+    _emit_bulk(workflow.bulk(post, [[path] for path in args.files], \
+        concurrency = args.concurrency))
+
+def _agent_ids(args):
+    'Returns the agent ids given with --agent, or selected with --where.'
+    if args.agent:
+        return args.agent
+    return [facts['agentid'] for facts in _devices(args) if 'agentid' in facts]
+
+def _page_size(value):
+    size = int(value)
+    if not 1 <= size <= 100:
+        raise argparse.ArgumentTypeError('page size must be from 1 to 100')
+    return size
+
+def _targets(parser):
+    'Adds the mutually exclusive --agent and --where options.'
+    group = parser.add_mutually_exclusive_group(required = True)
+    group.add_argument('--agent', action = 'append', metavar = 'AGENTID', \
+        help = 'agent id of a target device; may be repeated')
+    group.add_argument('--where', metavar = 'EXPR', \
+        help = 'filter expression selecting the target devices')
+
+def _journaled(parser):
+    'Adds the --journal and --job options.'
+    parser.add_argument('--journal', metavar = 'PATH', \
+        help = 'SQLite journal used to resume an interrupted run')
+    parser.add_argument('--job', help = 'journal job name')
+
+def _options(default):
+    """Returns a parent parser with the bulk options. Subcommands use
+    `argparse.SUPPRESS` so options given before the subcommand are kept."""
+    options = argparse.ArgumentParser(add_help = False)
+    options.add_argument('--concurrency', type = int, \
+        default = 1 if default else argparse.SUPPRESS, metavar = 'N', \
+        help = 'requests made at the same time by bulk operations \
+        (default: 1)')
+    options.add_argument('--page-size', type = _page_size, \
+        default = 100 if default else argparse.SUPPRESS, metavar = 'N', \
+        help = 'items per page, or agent ids per command request \
+        (default: 100)')
+    return options
+
+def parser():
+    'Returns the argument parser of the `addytool` command.'
+    common = _options(False)
+    main = argparse.ArgumentParser(prog = 'addytool', \
+        parents = [_options(True)], \
+        description = 'Manage Addigy from the command line. Results are \
+        printed as JSON lines.')
+    commands = main.add_subparsers(dest = 'command', metavar = 'COMMAND')
+
+    def add(subparsers, name, function, help):
+        sub = subparsers.add_parser(name, parents = [common], help = help, \
+            description = help)
+        sub.set_defaults(function = function)
+        return sub
+
+    add(commands, 'auth', auth, 'validate or update the keychain credentials')
+
+    sub = add(commands, 'devices', devices, 'list devices')
+    sub.add_argument('--online', action = 'store_true', \
+        help = 'only devices currently online')
+    sub.add_argument('--where', metavar = 'EXPR', \
+        help = 'filter expression, e.g. \'"OS Version" < "14.0"\'')
+
+    sub = add(commands, 'apps', apps, 'list installed applications per device')
+    sub.add_argument('--flat', action = 'store_true', \
+        help = 'one line per installed application instead of per device')
+
+    sub = add(commands, 'alerts', alerts, 'list alerts')
+    sub.add_argument('--status', help = 'e.g. Unattended, Acknowledged or \
+        Resolved')
+
+    add(commands, 'maintenance', maintenance, 'list completed maintenance')
+
+    group = commands.add_parser('policies', help = 'list and manage policies')
+    group.set_defaults(usage = group)
+    policies = group.add_subparsers(dest = 'action', metavar = 'ACTION')
+    add(policies, 'list', policies_list, 'list policies')
+    sub = add(policies, 'create', policies_create, 'create a policy')
+    sub.add_argument('name')
+    sub.add_argument('--parent', metavar = 'POLICYID', help = 'parent policy')
+    sub.add_argument('--icon', help = 'font awesome icon, e.g. "fa fa-users"')
+    sub.add_argument('--color', help = 'icon color, e.g. "#000000"')
+    sub = add(policies, 'devices', policies_devices, 'list devices in a policy')
+    sub.add_argument('policy_id')
+    sub = add(policies, 'assign', policies_assign, 'assign devices to a policy')
+    sub.add_argument('policy_id')
+    _targets(sub)
+    _journaled(sub)
+    sub = add(policies, 'instructions', policies_instructions, \
+        'list instructions in a policy')
+    sub.add_argument('policy_id')
+    sub = add(policies, 'add-instruction', policies_add_instruction, \
+        'add instructions to a policy')
+    sub.add_argument('policy_id')
+    sub.add_argument('instruction_ids', nargs = '+', metavar = 'INSTRUCTIONID')
+    _journaled(sub)
+
+    group = commands.add_parser('commands', help = 'run commands and read \
+        their output')
+    group.set_defaults(usage = group)
+    run = group.add_subparsers(dest = 'action', metavar = 'ACTION')
+    sub = add(run, 'run', commands_run, 'run a command on devices')
+    sub.add_argument('command')
+    _targets(sub)
+    _journaled(sub)
+    sub = add(run, 'output', commands_output, 'get the output of a command')
+    sub.add_argument('actionid')
+    sub.add_argument('agentid')
+
+    sub = add(commands, 'upload', upload, 'upload files to Addigy')
+    sub.add_argument('files', nargs = '+', metavar = 'FILE')
+
+    return main
+
+def main(argv = None):
+    """Runs the `addytool` command.
+
+    Args:
+        argv (list of str): Optionally, the arguments. Defaults to
+            `sys.argv[1:]`.
+    Returns:
+        Exit status (int).
+    """
+    main_parser = parser()
+    args = main_parser.parse_args(argv)
+    function = getattr(args, 'function', None)
+    if function is None:
+        getattr(args, 'usage', main_parser).print_help()
+        return 2
+    if getattr(args, 'where', None):
+        filters, = _modules('filters')
+        try:
+            args.where = filters.compile(args.where)
+        except ValueError as error:
+            main_parser.error('invalid --where expression: %s' % error)
+    try:
+        return function(args) or 0
+    except KeyboardInterrupt:
+        return 130
+    except IOError as error:
+        if getattr(error, 'errno', None) == 32: # EPIPE, e.g. piped to `head`
+            return 0
+        raise
+
+if __name__ == '__main__':
+    sys.exit(main())
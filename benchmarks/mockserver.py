@@ -0,0 +1,524 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`mockserver` is a local stand-in for the Addigy API used by the benchmarks.
+
+    It serves the endpoints wrapped by :mod:`endpoint` from a generated fleet,
+    including the file-manager upload flow, with configurable fleet size,
+    latency, error rate and rate limit. Point addytool at it with:
+
+        endpoint.Endpoint.base_url = server.url
+        endpoint.FileUpload.base_url = server.url
+
+    Run standalone with `python benchmarks/mockserver.py --devices 5000`.
+    """
+
+import argparse, hashlib, json, random, re, threading, time, uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+APPLICATIONS = ['Google Chrome', 'Firefox', 'Slack', 'Microsoft Word', \
+    'Microsoft Excel', 'Zoom', 'Adobe Acrobat Reader DC', '1Password 7', \
+    'Visual Studio Code', 'Spotify', 'Dropbox', 'Microsoft Teams']
+FACTS = ['Gatekeeper Enabled', 'FileVault Enabled', 'Battery Percentage', \
+    'Free Disk Percentage', 'Firewall Enabled']
+LEVELS = ['info', 'warning', 'critical']
+STATUSES = ['Unattended', 'Acknowledged', 'Resolved']
+
+class Fleet(object):
+    'Deterministically generated organization data.'
+
+    def __init__(self, devices = 1000, alerts = None, maintenance = None, \
+            policies = 20, profiles = 200, software = 100, seed = 0):
+        """Generates the fleet.
+
+        Args:
+            devices (int): Number of devices.
+            alerts (int): Number of alerts. (Default is 5 per device)
+            maintenance (int): Number of maintenance records. (Default is 2
+                per device)
+            policies (int): Number of policies.
+            profiles (int): Number of profiles.
+            software (int): Number of custom software items.
+            seed (int): Random seed.
+        """
+        rng = random.Random(seed)
+        self.orgid = str(uuid.UUID(int = rng.getrandbits(128)))
+        self.devices = [self._device(rng, index) for index in range(devices)]
+        self.agentids = [device['agentid'] for device in self.devices]
+        self.online = set(rng.sample(self.agentids, len(self.agentids) // 3))
+        self.applications = [{
+            'agentid': agentid,
+            'installed_applications': [{
+                'name': name,
+                'path': '/Applications/%s.app' % name,
+                'version': '%d.%d.%d' % (rng.randint(1, 90), rng.randint(0, 9), \
+                    rng.randint(0, 20)),
+                } for name in rng.sample(APPLICATIONS, rng.randint(3, 10))],
+            } for agentid in self.agentids]
+        if alerts is None:
+            alerts = devices * 5
+        if maintenance is None:
+            maintenance = devices * 2
+        self.alerts = [self._alert(rng, index) for index in range(alerts)]
+        self.maintenance = [self._maintenance(rng, index) \
+            for index in range(maintenance)]
+        self.policies = [{
+            'policyId': self._uuid(rng),
+            'parent': None,
+            'name': 'Policy %d' % index,
+            'icon': 'fa fa-university',
+            'color': '#000000',
+            'creation_time': 1468261319 + index,
+            'download_path': 'https://prod.addigy.com/download/addigy_agent/',
+            'orgid': self.orgid,
+            } for index in range(policies)]
+        self.policy_devices = {}
+        self.policy_instructions = {}
+        self.profiles = [{
+            'instruction_id': self._uuid(rng),
+            'name': 'Profile %d' % index,
+            'payloads': [{'payload_identifier': 'com.example.profile%d' % index,
+                'payload_type': 'com.apple.wifi.managed'}],
+            'orgid': self.orgid,
+            } for index in range(profiles)]
+        self.software = [self._software(rng, index) for index in range(software)]
+        self.actions = {}
+        self.lock = threading.Lock()
+
+    def _uuid(self, rng):
+        return str(uuid.UUID(int = rng.getrandbits(128)))
+
+    def _device(self, rng, index):
+        return {
+            'agentid': self._uuid(rng),
+            'Device Name': 'mac-%05d' % index,
+            'Serial Number': 'C02%07d' % index,
+            'OS Version': rng.choice(['10.13.6', '10.14.6', '10.15.7', \
+                '11.7.10', '12.7.1', '13.6.3', '14.2.1']),
+            'Battery Percentage': rng.randint(0, 100),
+            'Free Disk Percentage': rng.randint(1, 95),
+            'FileVault Enabled': rng.random() < 0.8,
+            'Gatekeeper Enabled': rng.random() < 0.9,
+            'Firewall Enabled': rng.random() < 0.7,
+            'Hardware Model': rng.choice(['MacBookPro15,1', 'MacBookAir8,1', \
+                'iMac19,1', 'Macmini8,1']),
+            'Total Memory (GB)': rng.choice([8, 16, 32, 64]),
+            'orgid': self.orgid,
+            'policy_id': None,
+            }
+
+    def _alert(self, rng, index):
+        fact = rng.choice(FACTS)
+        return {
+            '_id': self._uuid(rng),
+            'actionid': self._uuid(rng),
+            'agentid': rng.choice(self.agentids),
+            'category': 'Security',
+            'created_on': 1542693878.0 + index * 60,
+            'emails': ['jdoe@example.com'],
+            'fact': fact,
+            'level': rng.choice(LEVELS),
+            'name': fact + ' Alert',
+            'orgid': self.orgid,
+            'remediationstatus': 'Done',
+            'remenabled': True,
+            'remtime': 15,
+            'resolveddate': None,
+            'resolveduseremail': None,
+            'selector': '=',
+            'status': rng.choice(STATUSES),
+            'value': False,
+            'valuetype': 'boolean',
+            }
+
+    def _maintenance(self, rng, index):
+        return {
+            '_id': self._uuid(rng),
+            'agentid': rng.choice(self.agentids),
+            'jobid': self._uuid(rng),
+            'jobtime': rng.randint(1, 30),
+            'trycount': 1,
+            'maxtrycount': 3,
+            'promptuser': False,
+            'exitcode': rng.choice([0, 0, 0, 1]),
+            'maintenancetype': 'maintenance',
+            'scheduledtime': '2019-02-23T15:02:11Z',
+            'status': 'finished',
+            'orgid': self.orgid,
+            'actiontype': 'maintenance',
+            'scheduled_maintenance_id': self._uuid(rng),
+            'maintenancename': 'Job %d' % (index % 50),
+            }
+
+    def _software(self, rng, index):
+        name = 'Software %d' % (index // 3)
+        version = '%d.%d' % (1 + index % 3, rng.randint(0, 9))
+        return {
+            'instructionId': self._uuid(rng),
+            'base_identifier': name,
+            'identifier': '%s-%s' % (name, self._uuid(rng)),
+            'name': '%s (%s)' % (name, version),
+            'label': 'Custom Software - %s (%s)' % (name, version),
+            'version': version,
+            'category': rng.choice(['General', 'Productivity', 'Security']),
+            'installation_script': '#!/bin/bash\n' + 'echo install\n' * 50,
+            'condition': '#!/bin/bash\nexit 0\n',
+            'remove_script': '#!/bin/bash\n' + 'echo remove\n' * 20,
+            'provider': 'ansible-custom-software',
+            'downloads': [],
+            'orgid': self.orgid,
+            }
+
+class Server(ThreadingMixIn, HTTPServer):
+    'Threaded mock Addigy server. Use `start` and `stop`.'
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fleet = None, host = '127.0.0.1', port = 0, \
+            latency = 0.0, error_rate = 0.0, rate_limit = None, \
+            client_id = 'bench', client_secret = 'bench', seed = 0):
+        """Creates the server without starting it.
+
+        Args:
+            fleet (Fleet): Optionally, the fleet to serve. (Default is a
+                1000-device `Fleet`)
+            host (str): Address to bind.
+            port (int): Port to bind. 0 picks a free port.
+            latency (float): Seconds added to every response.
+            error_rate (float): Fraction of requests answered with status 500.
+            rate_limit (float): Optionally, requests per second allowed before
+                answering with status 429.
+            client_id (str): Client id accepted by the server.
+            client_secret (str): Client secret accepted by the server.
+            seed (int): Random seed for injected errors.
+        """
+        HTTPServer.__init__(self, (host, port), Handler)
+        self.fleet = fleet if fleet is not None else Fleet()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.credentials = (client_id, client_secret)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = rate_limit or 0
+        self.updated = time.time()
+        self.requests = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        'Base URL of the server, ending with a slash.'
+        return 'http://%s:%d/' % self.server_address[:2]
+
+    def start(self):
+        'Serves requests from a background thread.'
+        self.thread = threading.Thread(target = self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        'Stops serving and closes the socket.'
+        self.shutdown()
+        self.server_close()
+
+    def admit(self):
+        'Returns None to serve the request, or an error status code.'
+        with self.lock:
+            self.requests += 1
+            if self.rate_limit:
+                now = time.time()
+                self.tokens = min(self.rate_limit, \
+                    self.tokens + (now - self.updated) * self.rate_limit)
+                self.updated = now
+                if self.tokens < 1:
+                    return 429
+                self.tokens -= 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                return 500
+        return None
+
+class Handler(BaseHTTPRequestHandler):
+    'Routes requests to the fleet.'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+        if server.latency:
+            time.sleep(server.latency)
+        parsed = urlparse(self.path)
+        self.query = dict((key, values[-1]) for key, values \
+            in parse_qs(parsed.query).items())
+        path = parsed.path.strip('/')
+
+        status = server.admit()
+        if status == 429:
+            return self.reply(429, {'error': 'rate limited'}, \
+                {'Retry-After': '0.05'})
+        if status is not None:
+            return self.reply(status, {'error': 'injected error'})
+        if not path.startswith('upload/') and (self.headers.get('client-id'), \
+                self.headers.get('client-secret')) != server.credentials:
+            return self.reply(401, {'error': 'unauthorized'})
+
+        if method == 'POST' and path.startswith('upload/'):
+            route = _upload
+        else:
+            route = ROUTES.get((method, path))
+        if route is None:
+            return self.reply(404, {'error': 'not found'})
+        status, payload = route(self, server.fleet)
+        self.reply(status, payload)
+
+    def reply(self, status, payload, headers = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8')) if self.body else {}
+
+    def form(self):
+        return dict((key, values[-1]) for key, values \
+            in parse_qs(self.body.decode('utf-8')).items())
+
+def _page(handler, items):
+    per_page = int(handler.query.get('per_page') or 20)
+    if per_page < 1 or per_page > 100:
+        per_page = 20
+    page = max(1, int(handler.query.get('page') or 1))
+    return items[(page - 1) * per_page:page * per_page]
+
+def _alerts(handler, fleet):
+    alerts = fleet.alerts
+    status = handler.query.get('status')
+    if status:
+        alerts = [alert for alert in alerts if alert['status'] == status]
+    return 200, _page(handler, alerts)
+
+def _policies_post(handler, fleet):
+    form = handler.form()
+    policy = {
+        'policyId': str(uuid.uuid4()),
+        'parent': form.get('parent_id'),
+        'name': form.get('name'),
+        'icon': form.get('icon'),
+        'color': form.get('color'),
+        'creation_time': int(time.time()),
+        'download_path': 'https://prod.addigy.com/download/addigy_agent/',
+        'orgid': fleet.orgid,
+        }
+    with fleet.lock:
+        fleet.policies.append(policy)
+    return 200, policy
+
+def _policies_devices_get(handler, fleet):
+    members = fleet.policy_devices.get(handler.query.get('policy_id'), set())
+    return 200, [device for device in fleet.devices \
+        if device['agentid'] in members]
+
+def _policies_devices_post(handler, fleet):
+    form = handler.form()
+    with fleet.lock:
+        for members in fleet.policy_devices.values():
+            members.discard(form.get('agent_id'))
+        fleet.policy_devices.setdefault(form.get('policy_id'), set()) \
+            .add(form.get('agent_id'))
+    return 200, ''
+
+def _policies_instructions_get(handler, fleet):
+    return 200, [{'instructionid': instruction_id} for instruction_id \
+        in fleet.policy_instructions.get(handler.query.get('policy_id'), [])]
+
+def _policies_instructions_post(handler, fleet):
+    data = handler.json()
+    with fleet.lock:
+        instructions = fleet.policy_instructions.setdefault( \
+            data.get('policy_id'), [])
+        if data.get('instruction_id') in instructions:
+            return 200, 'Instruction already in policy'
+        instructions.append(data.get('instruction_id'))
+    return 200, 'ok'
+
+def _policies_instructions_delete(handler, fleet):
+    data = handler.json()
+    with fleet.lock:
+        instructions = fleet.policy_instructions.get(data.get('policy_id'), [])
+        if data.get('instruction_id') in instructions:
+            instructions.remove(data.get('instruction_id'))
+    return 200, 'ok'
+
+def _policies_details(handler, fleet):
+    policy_id = handler.query.get('policy_id')
+    return 200, {'deployed_instructions': [{
+        'status': 'done', 'msg': '', 'instructionid': instruction_id,
+        'orgid': fleet.orgid, 'agentid': agentid,
+        } for instruction_id in fleet.policy_instructions.get(policy_id, []) \
+        for agentid in fleet.policy_devices.get(policy_id, ())]}
+
+def _commands(handler, fleet):
+    data = handler.json()
+    jobid = str(uuid.uuid4())
+    actionids = []
+    with fleet.lock:
+        for agentid in data.get('agents_ids') or []:
+            actionid = str(uuid.uuid4())
+            fleet.actions[(actionid, agentid)] = data.get('command')
+            actionids.append({'agentid': agentid, 'actionid': actionid})
+    return 200, {'actionids': actionids, 'jobid': jobid, '_id': jobid}
+
+def _output(handler, fleet):
+    key = (handler.query.get('actionid'), handler.query.get('agentid'))
+    if key not in fleet.actions:
+        return 200, {'stdout': '', 'stderr': 'Action not found', 'exitstatus': 1}
+    return 200, {'stdout': 'ran: %s\n' % fleet.actions[key], 'stderr': '', \
+        'exitstatus': 0}
+
+def _profiles_get(handler, fleet):
+    instruction_id = handler.query.get('instruction_id')
+    if instruction_id:
+        return 200, [profile for profile in fleet.profiles \
+            if profile['instruction_id'] == instruction_id]
+    return 200, fleet.profiles
+
+def _profiles_delete(handler, fleet):
+    instruction_id = handler.json().get('instruction_id')
+    with fleet.lock:
+        for index, profile in enumerate(fleet.profiles):
+            if profile['instruction_id'] == instruction_id:
+                del fleet.profiles[index]
+                return 200, 'ok'
+    return 200, 'Instruction not found'
+
+def _custom_software_get(handler, fleet):
+    instruction_id = handler.query.get('instructionid')
+    identifier = handler.query.get('identifier')
+    items = fleet.software
+    if instruction_id:
+        items = [item for item in items if item['instructionId'] == instruction_id]
+    if identifier:
+        items = [item for item in items if item['identifier'] == identifier \
+            or item['base_identifier'] == identifier]
+    return 200, items
+
+def _custom_software_post(handler, fleet):
+    data = handler.json()
+    base_identifier = data.get('base_identifier') or \
+        re.sub(r'-[0-9a-f-]{36}$', '', data.get('identifier') or '')
+    version = data.get('version')
+    item = {
+        'instructionId': str(uuid.uuid4()),
+        'base_identifier': base_identifier,
+        'identifier': data.get('identifier') or \
+            '%s-%s' % (base_identifier, uuid.uuid4()),
+        'name': '%s (%s)' % (base_identifier, version),
+        'label': 'Custom Software - %s (%s)' % (base_identifier, version),
+        'version': version,
+        'category': 'General',
+        'installation_script': data.get('installation_script'),
+        'condition': data.get('condition'),
+        'remove_script': data.get('remove_script'),
+        'provider': 'ansible-custom-software',
+        'downloads': data.get('downloads') or [],
+        'orgid': fleet.orgid,
+        }
+    with fleet.lock:
+        fleet.software.append(item)
+    return 200, item
+
+def _validate(handler, fleet):
+    return 200, {'status': 'ok'}
+
+def _upload_url(handler, fleet):
+    return 200, '%supload/%s' % (handler.server.url, uuid.uuid4())
+
+def _upload(handler, fleet):
+    return 200, {
+        'id': str(uuid.uuid4()),
+        'orgid': fleet.orgid,
+        'user_email': 'bench@example.com',
+        'content_type': 'application/octet-stream',
+        'filename': 'upload',
+        'size': len(handler.body),
+        'md5_hash': hashlib.md5(handler.body).hexdigest(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'provider': 'cloud-storage',
+        }
+
+ROUTES = {
+    ('GET', 'api/devices'): lambda handler, fleet: (200, fleet.devices),
+    ('GET', 'api/devices/online'): lambda handler, fleet: (200, \
+        [device for device in fleet.devices if device['agentid'] in fleet.online]),
+    ('POST', 'api/devices/commands'): _commands,
+    ('GET', 'api/devices/output'): _output,
+    ('GET', 'api/applications'): lambda handler, fleet: (200, fleet.applications),
+    ('GET', 'api/alerts'): _alerts,
+    ('GET', 'api/maintenance'): lambda handler, fleet: (200, \
+        _page(handler, fleet.maintenance)),
+    ('GET', 'api/policies'): lambda handler, fleet: (200, fleet.policies),
+    ('POST', 'api/policies'): _policies_post,
+    ('GET', 'api/policies/details'): _policies_details,
+    ('GET', 'api/policies/devices'): _policies_devices_get,
+    ('POST', 'api/policies/devices'): _policies_devices_post,
+    ('GET', 'api/policies/instructions'): _policies_instructions_get,
+    ('POST', 'api/policies/instructions'): _policies_instructions_post,
+    ('DELETE', 'api/policies/instructions'): _policies_instructions_delete,
+    ('GET', 'api/profiles'): _profiles_get,
+    ('DELETE', 'api/profiles'): _profiles_delete,
+    ('GET', 'api/catalog/public'): lambda handler, fleet: (200, fleet.software),
+    ('GET', 'api/custom-software'): _custom_software_get,
+    ('POST', 'api/custom-software'): _custom_software_post,
+    ('POST', 'api/validate'): _validate,
+    ('GET', 'api/upload/url'): _upload_url,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--devices', type = int, default = 1000)
+    parser.add_argument('--latency', type = float, default = 0.0)
+    parser.add_argument('--error-rate', type = float, default = 0.0)
+    parser.add_argument('--rate-limit', type = float, default = None)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+    server = Server(Fleet(args.devices, seed = args.seed), args.host, \
+        args.port, args.latency, args.error_rate, args.rate_limit, \
+        seed = args.seed)
+    print('Mock Addigy API serving %d devices at %s' % (args.devices, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""`run` benchmarks addytool's endpoint classes and bulk workflows against the
+    local mock Addigy server in :mod:`mockserver`.
+
+    For each benchmark it reports throughput, p50/p99 latency per operation and
+    peak traced memory, measured in a separate, untimed run. Results can be saved with --json and compared with a
+    previous run with --compare, which flags regressions beyond --threshold.
+
+    Example:
+        python benchmarks/run.py --devices 5000 --json baseline.json
+        python benchmarks/run.py --devices 5000 --compare baseline.json
+    """
+
+import argparse, json, multiprocessing, os, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'addytool'))
+
+import mockserver
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+BENCHMARKS = []
+
+def benchmark(name, operations = 20):
+    """Registers a benchmark.
+
+    Args:
+        name (str): Name reported in the results.
+        operations (int): Times the benchmark function is called.
+    """
+    def register(function):
+        BENCHMARKS.append((name, operations, function))
+        return function
+    return register
+
+@benchmark('Devices.get', operations = 10)
+def devices_get(fleet):
+    import endpoint
+    return len(endpoint.Devices().get())
+
+@benchmark('DevicesOnline.get', operations = 10)
+def devices_online_get(fleet):
+    import endpoint
+    return len(endpoint.DevicesOnline().get())
+
+@benchmark('Applications.get', operations = 10)
+def applications_get(fleet):
+    import endpoint
+    return len(endpoint.Applications().get())
+
+@benchmark('Alerts.get (all pages)', operations = 3)
+def alerts_all_pages(fleet):
+    import endpoint
+    alerts, page, total = endpoint.Alerts(), 1, 0
+    while True:
+        items = alerts.get(per_page = 100, page = page)
+        if not items:
+            return total
+        total += len(items)
+        page += 1
+
+@benchmark('Maintenance.get (all pages)', operations = 3)
+def maintenance_all_pages(fleet):
+    import endpoint
+    maintenance, page, total = endpoint.Maintenance(), 1, 0
+    while True:
+        items = maintenance.get(per_page = 100, page = page)
+        if not items:
+            return total
+        total += len(items)
+        page += 1
+
+@benchmark('Policies.get', operations = 50)
+def policies_get(fleet):
+    import endpoint
+    return len(endpoint.Policies().get())
+
+@benchmark('PoliciesInstructions.post', operations = 50)
+def policies_instructions_post(fleet):
+    import endpoint
+    return endpoint.PoliciesInstructions().post(fleet['policy_id'], \
+        fleet['instruction_id'])
+
+@benchmark('DevicesCommands.post', operations = 50)
+def devices_commands_post(fleet):
+    import endpoint
+    return len(endpoint.DevicesCommands().post(fleet['agentids'][:10], \
+        'uptime')['actionids'])
+
+@benchmark('DevicesOutput.get', operations = 50)
+def devices_output_get(fleet):
+    import endpoint
+    return endpoint.DevicesOutput().get(fleet['actionid'], fleet['agentids'][0])
+
+@benchmark('Validate.post', operations = 50)
+def validate_post(fleet):
+    import endpoint
+    return endpoint.Validate().post()
+
+@benchmark('FileUpload.post', operations = 20)
+def file_upload_post(fleet):
+    import endpoint
+    return endpoint.FileUpload().post(fleet['upload'])
+
+@benchmark('workflow.bulk_command', operations = 3)
+def bulk_command(fleet):
+    import workflow
+    return len(workflow.bulk_command(fleet['agentids'], 'uptime'))
+
+@benchmark('workflow.bulk_command (journaled)', operations = 3)
+def bulk_command_journaled(fleet):
+    import journal, workflow
+    return len(workflow.bulk_command(fleet['agentids'], 'uptime', \
+        journal = journal.Journal(':memory:')))
+
+@benchmark('workflow.bulk_assign_policy', operations = 1)
+def bulk_assign_policy(fleet):
+    import workflow
+    return len(workflow.bulk_assign_policy(fleet['policy_id'], \
+        fleet['agentids'][:500]))
+
+@benchmark('analytics.version_drift', operations = 3)
+def version_drift(fleet):
+    import analytics
+    return analytics.version_drift().devices
+
+def serve(queue, devices, latency, error_rate, rate_limit):
+    'Runs the mock server in a child process and reports its URL.'
+    server = mockserver.Server(mockserver.Fleet(devices), latency = latency, \
+        error_rate = error_rate, rate_limit = rate_limit)
+    queue.put(server.url)
+    server.serve_forever()
+
+def percentile(values, fraction):
+    'Returns the nearest-rank percentile of sorted `values`.'
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+def measure(function, operations, fleet):
+    """Runs `function` `operations` times for timing, then once more with
+    tracemalloc to measure peak memory, so tracing does not slow the timed
+    runs.
+
+    Returns:
+        Python dictionary of results.
+    """
+    function(fleet)
+    latencies = []
+    started = time.time()
+    for operation in range(operations):
+        start = time.time()
+        function(fleet)
+        latencies.append(time.time() - start)
+    elapsed = time.time() - started
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            function(fleet)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    latencies.sort()
+    return {
+        'operations': operations,
+        'seconds': elapsed,
+        'throughput': operations / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p99': percentile(latencies, 0.99),
+        'peak_bytes': peak,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--devices', type = int, default = 1000)
+    parser.add_argument('--latency', type = float, default = 0.0)
+    parser.add_argument('--error-rate', type = float, default = 0.0)
+    parser.add_argument('--rate-limit', type = float, default = None)
+    parser.add_argument('--filter', default = '', \
+        help = 'Only run benchmarks whose name contains this text.')
+    parser.add_argument('--json', help = 'Write results to this file.')
+    parser.add_argument('--compare', help = 'Compare with results saved by --json.')
+    parser.add_argument('--threshold', type = float, default = 0.10, \
+        help = 'Relative slowdown reported as a regression. (Default is 0.10)')
+    args = parser.parse_args()
+
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target = serve, args = (queue, \
+        args.devices, args.latency, args.error_rate, args.rate_limit))
+    server.daemon = True
+    server.start()
+    url = queue.get(timeout = 120)
+
+    import endpoint
+    endpoint.Endpoint.base_url = url
+    endpoint.FileUpload.base_url = url
+    credentials = {'client_id': 'bench', 'client_secret': 'bench'}
+    _bind_credentials(endpoint, credentials)
+
+    upload = tempfile.NamedTemporaryFile(delete = False)
+    upload.write(os.urandom(256 * 1024))
+    upload.close()
+    agentids = [device['agentid'] for device in endpoint.Devices().get()]
+    commands = endpoint.DevicesCommands().post(agentids[:1], 'uptime')
+    fleet = {
+        'agentids': agentids,
+        'actionid': commands['actionids'][0]['actionid'],
+        'policy_id': endpoint.Policies().get()[0]['policyId'],
+        'instruction_id': 'bench-instruction',
+        'upload': upload.name,
+        }
+
+    results = {}
+    print('%-36s %8s %10s %10s %10s %10s' % ('benchmark', 'ops', 'ops/s', \
+        'p50 ms', 'p99 ms', 'peak KiB'))
+    try:
+        for name, operations, function in BENCHMARKS:
+            if args.filter not in name:
+                continue
+            result = results[name] = measure(function, operations, fleet)
+            print('%-36s %8d %10.1f %10.2f %10.2f %10s' % (name, operations, \
+                result['throughput'], result['p50'] * 1000, result['p99'] * 1000, \
+                '-' if result['peak_bytes'] is None \
+                else '%d' % (result['peak_bytes'] // 1024)))
+    finally:
+        os.unlink(upload.name)
+        server.terminate()
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'devices': args.devices, 'results': results}, output, \
+                indent = 2, sort_keys = True)
+    if args.compare:
+        return compare(args.compare, results, args.threshold)
+    return 0
+
+def compare(path, results, threshold):
+    'Prints regressions against saved results. Returns 1 if any were found.'
+    with open(path) as saved:
+        baseline = json.load(saved)['results']
+    regressions = 0
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for metric in ('p50', 'p99', 'peak_bytes'):
+            before, after = baseline[name].get(metric), results[name].get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / float(before)
+            if change > threshold:
+                regressions += 1
+                print('REGRESSION %s %s: %.4g -> %.4g (%+.0f%%)' % (name, \
+                    metric, before, after, change * 100))
+    if not regressions:
+        print('No regressions beyond %.0f%%.' % (threshold * 100))
+    return 1 if regressions else 0
+
+def _bind_credentials(endpoint, credentials):
+    'Makes every endpoint use the mock server credentials instead of keyring.'
+    class Credentials(object):
+        session = None
+        rate_limiter = None
+
+        def credentials(self, client_id = None, client_secret = None):
+            return client_id or credentials['client_id'], \
+                client_secret or credentials['client_secret']
+
+    endpoint.Endpoint.organization = Credentials()
+    endpoint.FileUpload.organization = endpoint.Endpoint.organization
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,6 +13,12 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/Addigy-Community/addytool",
     packages=setuptools.find_packages(),
+    py_modules=['addytool_cli'],
+    entry_points={
+        'console_scripts': [
+            'addytool=addytool_cli:main',
+        ],
+    },
     classifiers=[
         "Operating System :: MacOS :: MacOS X",
     ],
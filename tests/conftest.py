@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Shared fixtures for the addytool tests.
+
+    The modules of addytool import each other by name, so the package
+    directory is put on `sys.path` and modules are imported directly, which
+    also skips the authentication done by the package `__init__`.
+    """
+
+import json, os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname( \
+    os.path.abspath(__file__))), 'addytool'))
+
+import endpoint
+
+class FakeResponse(object):
+    'Minimal stand-in for :class:`requests.Response`.'
+
+    def __init__(self, status_code = 200, data = None, headers = None):
+        self.status_code = status_code
+        self.text = json.dumps(data)
+        self.content = self.text.encode('utf-8')
+        self.headers = headers or {}
+        self.request = None
+
+    def iter_content(self, chunk_size = 1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+class FakeTransport(object):
+    """Answers requests from a `respond(method, url, kwargs)` function and
+    records every request made."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+
+    def request(self, session, method, url, headers = None, **kwargs):
+        self.requests.append((method, url, kwargs))
+        return self.respond(method, url, kwargs)
+
+@pytest.fixture(autouse = True)
+def credentials(monkeypatch):
+    'Keeps the tests away from the real keychain.'
+    monkeypatch.setattr(endpoint.keyring, 'get_password', \
+        lambda service, name: 'test')
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Installs a FakeTransport. Tests set `transport.respond`; the default
+    answers every request with status 200 and {"ok": true}."""
+    fake = FakeTransport(lambda method, url, kwargs: FakeResponse(200, \
+        {'ok': True}))
+    monkeypatch.setattr(endpoint, 'transport', fake)
+    monkeypatch.setattr(endpoint.time, 'sleep', lambda seconds: None)
+    return fake
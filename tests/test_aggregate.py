@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import aggregate
+
+NOW = 1700000000.0
+
+class Alerts(object):
+    'Paginated stand-in for `endpoint.Alerts`.'
+
+    def __init__(self, alerts):
+        self.alerts = alerts
+        self.pages = 0
+
+    def get(self, per_page = None, page = None, status = None):
+        self.pages += 1
+        start = (page - 1) * per_page
+        return self.alerts[start:start + per_page]
+
+def _alerts(count, start, step, prefix = 'alert'):
+    return [{'_id': '%s-%d' % (prefix, index), 'created_on': start + index * step, \
+        'agentid': 'agent-%d' % (index % 7), 'fact': 'fact-%d' % (index % 3), \
+        'name': 'n', 'level': 'warning', 'status': 'Unattended'} \
+        for index in range(count)]
+
+def test_poll_reads_oldest_first_backlog_to_the_end():
+    # 10 days of alerts, one per 10 minutes, oldest first.
+    alerts = _alerts(1440, NOW - 10 * 86400, 600)
+    aggregator = aggregate.AlertAggregator(clock = lambda: NOW)
+    added = aggregator.poll(Alerts(alerts), per_page = 100)
+    # Windows are kept to bucket resolution, one hour for '7d'.
+    newest_week = [alert for alert in alerts if alert['created_on'] > \
+        NOW - 7 * 86400 + 3600]
+    assert len(newest_week) <= added <= len(newest_week) + 6
+    assert aggregator.total('7d') == added
+    assert aggregator.total('24h') >= 144 - 2
+
+def test_poll_stops_at_a_page_already_seen():
+    alerts = _alerts(500, NOW - 1800, 1)[::-1]
+    aggregator = aggregate.AlertAggregator(clock = lambda: NOW)
+    assert aggregator.poll(Alerts(alerts), per_page = 100) == 500
+    newer = _alerts(100, NOW - 50, 0.1, prefix = 'newer')[::-1]
+    endpoint = Alerts(newer + alerts)
+    assert aggregator.poll(endpoint, per_page = 100) == 100
+    assert endpoint.pages == 2
+    assert aggregator.total('1h') == 600
+
+def test_forget_drops_old_ids_arriving_out_of_order():
+    clock = [NOW]
+    aggregator = aggregate.AlertAggregator(clock = lambda: clock[0])
+    aggregator.add({'_id': 'new', 'created_on': NOW})
+    aggregator.add({'_id': 'old', 'created_on': NOW - 6 * 86400})
+    clock[0] = NOW + 2 * 86400
+    aggregator.add({'_id': 'later', 'created_on': clock[0]})
+    assert 'old' not in aggregator.seen
+    assert set(aggregator.seen) == set(['new', 'later'])
+
+def test_top_and_counts():
+    aggregator = aggregate.AlertAggregator(clock = lambda: NOW)
+    assert aggregator.add_many(_alerts(70, NOW - 3000, 10)) == 70
+    assert aggregator.add_many(_alerts(70, NOW - 3000, 10)) == 0
+    assert aggregator.top('agentid', 1, '1h') == [('agent-0', 10)]
+    assert sum(aggregator.counts('fact', '1h').values()) == 70
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import random
+
+import analytics, catalog, filters, versions
+
+def _fleet(count = 300, seed = 5):
+    rng = random.Random(seed)
+    fleet = []
+    for index in range(count):
+        applications = [
+            {'name': 'Chrome', 'version': rng.choice( \
+                ['120.0', '120.0.0 (1)', '119.2', '121.0b2', '121.0', 'n/a'])},
+            {'name': 'Zoom', 'version': rng.choice(['5.16', '5.15.3', None])},
+            ]
+        if index % 50 == 0:
+            applications.append({'name': 'Rare', 'version': '1.0'})
+        fleet.append({'agentid': 'agent-%d' % index, \
+            'installed_applications': applications})
+    return fleet
+
+def _brute_force(fleet, min_devices):
+    'Returns the outliers of `fleet`, computed device by device.'
+    counts = {}
+    for device in fleet:
+        for application in device['installed_applications']:
+            parsed = versions.parse(application['version'])
+            if parsed is not None:
+                by_version = counts.setdefault(application['name'], {})
+                by_version[parsed[1]] = by_version.get(parsed[1], 0) + 1
+    outliers = {}
+    for device in fleet:
+        for application in device['installed_applications']:
+            name = application['name']
+            parsed = versions.parse(application['version'])
+            if parsed is None or sum(counts[name].values()) < min_devices:
+                continue
+            mode = max(counts[name], key = lambda version: \
+                (counts[name][version], versions.key(version)))
+            if parsed[0] < versions.key(mode):
+                outliers.setdefault(device['agentid'], []).append( \
+                    {'name': name, 'version': parsed[1], 'expected': mode})
+    return outliers
+
+def _sorted(outliers):
+    return dict((agentid, sorted(lags, key = lambda lag: lag['name'])) \
+        for agentid, lags in outliers.items())
+
+def test_outliers_match_a_device_by_device_count():
+    fleet = _fleet()
+    report = analytics.version_drift(fleet, processes = 1, shard_size = 7)
+    assert report.devices == len(fleet)
+    assert _sorted(report.outliers()) == _sorted(_brute_force(fleet, 10))
+    assert 'Rare' not in report.behind
+
+def test_workers_return_the_same_report():
+    fleet = _fleet()
+    single = analytics.version_drift(fleet, processes = 1, shard_size = 40)
+    pooled = analytics.version_drift(fleet, processes = 3, shard_size = 40)
+    assert pooled.summary() == single.summary()
+    assert _sorted(pooled.outliers()) == _sorted(single.outliers())
+    assert pooled.latest() == single.latest()
+
+def test_histogram_and_latest():
+    fleet = [{'agentid': str(index), 'installed_applications': \
+        [{'name': 'App', 'version': version}]} for index, version \
+        in enumerate(['2.0', '2.0.0', '2.0b1', '1.9', 'unknown'])]
+    report = analytics.version_drift(fleet, processes = 1, min_devices = 1)
+    assert report.histogram('App') == [('1.9', 1), ('2.0b1', 1), ('2.0', 2)]
+    assert report.latest('App')['version'] == '2.0'
+    assert report.common('App') == {'version': '2.0', 'devices': 2, \
+        'share': 0.5}
+    assert report.unparsed['App'] == 1
+    assert sorted(report.outliers()) == ['2', '3']
+
+def test_worker_errors_are_raised():
+    fleet = _fleet(20) + ['not a device']
+    try:
+        analytics.version_drift(fleet, processes = 2, shard_size = 5)
+    except AttributeError:
+        pass
+    else:
+        assert False, 'expected AttributeError'
+
+def test_every_module_orders_versions_alike():
+    values = ['10.2', '10.2b1', '9.9', '10.10', '10.2.1', '10.2rc1', '10.2.0']
+    ordered = sorted(values, key = versions.key)
+    assert sorted(values, key = catalog.version_key) == ordered
+    assert sorted(values, key = filters._version) == ordered
+    for index, value in enumerate(ordered[1:], 1):
+        assert versions.compare(ordered[index - 1], value) <= 0
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import random
+
+import catalog
+
+def _items(count = 600, seed = 3):
+    rng = random.Random(seed)
+    items = []
+    for index in range(count):
+        name = 'Software %d' % (index // 3)
+        version = '%d.%d' % (1 + index % 3, rng.randint(0, 9))
+        items.append({
+            'instructionId': 'id-%d' % index,
+            'base_identifier': name,
+            'name': '%s (%s)' % (name, version),
+            'version': version,
+            'category': rng.choice(['General', 'Productivity', 'Security']),
+            })
+    return items
+
+def _brute_force(index, query, limit):
+    tokens = catalog.tokenize(query)
+    matches = []
+    for item_id, tokens_of in index.tokens.items():
+        if all(token in tokens_of for token in tokens[:-1]) and \
+                any(indexed.startswith(tokens[-1]) for indexed in tokens_of):
+            matches.append(item_id)
+    matches.sort(key = index.order.__getitem__)
+    return [index.items[item_id] for item_id in matches[:limit]]
+
+def test_search_matches_brute_force():
+    index = catalog.CatalogIndex()
+    index.refresh(public = _items(), custom = [])
+    rng = random.Random(5)
+    words = ['software', 'security', 'general', 'productivity', 's', 'so', \
+        'gen', '1', '12', '199', 'x', '2']
+    for attempt in range(300):
+        query = ' '.join(rng.choice(words) for i in range(rng.randint(1, 3)))
+        limit = rng.choice([1, 5, 20, 500])
+        assert index.search(query, limit = limit) == \
+            _brute_force(index, query, limit), query
+
+def test_search_after_changes():
+    index = catalog.CatalogIndex()
+    items = _items(30)
+    index.refresh(public = items, custom = [])
+    assert len(index.search('software', limit = 100)) == 30
+    index.refresh(public = items[10:], custom = [])
+    assert len(index.search('software', limit = 100)) == 20
+    removed = set(item['instructionId'] for item in items[:10])
+    assert not removed.intersection(item['instructionId'] for item \
+        in index.search('software', limit = 100))
+
+def test_fuzzy_search():
+    index = catalog.CatalogIndex()
+    index.refresh(public = _items(30), custom = [])
+    assert index.search('sofware security') == []
+    assert index.search('sofware security', fuzzy = True) == \
+        index.search('software security')
+
+def test_version_key_orders_prereleases_before_releases():
+    versions = ['10.2', '10.2b1', '9.9', '10.10', '10.2.1', '10.2a3', '10.2.0']
+    assert sorted(versions, key = catalog.version_key) == \
+        ['9.9', '10.2a3', '10.2b1', '10.2', '10.2.0', '10.2.1', '10.10']
+    assert catalog.version_key('10.2') == catalog.version_key('10.2.0')
+
+def test_latest_is_the_release():
+    index = catalog.CatalogIndex()
+    for item_id, version in enumerate(['10.1', '10.2b1', '10.2', '10.2rc2']):
+        index.add({'instructionId': str(item_id), 'base_identifier': 'App', \
+            'name': 'App', 'version': version})
+    assert index.latest('App')['version'] == '10.2'
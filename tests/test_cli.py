@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import json, os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+    __file__))))
+
+import addytool_cli
+from conftest import FakeResponse
+
+DEVICES = [
+    {'agentid': 'a', 'OS Version': '9.1'},
+    {'agentid': 'b', 'OS Version': '13.6.1'},
+    {'agentid': 'c', 'OS Version': '14.0'},
+    ]
+
+def _lines(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+def test_devices_where(transport, capsys):
+    transport.respond = lambda method, url, kwargs: FakeResponse(200, DEVICES)
+    assert addytool_cli.main(['devices', '--where', '"OS Version" < "14"']) \
+        == 0
+    assert _lines(capsys) == DEVICES[:2]
+
+def test_invalid_where_is_a_usage_error(transport, capsys):
+    with pytest.raises(SystemExit) as exit:
+        addytool_cli.main(['devices', '--where', '"OS Version" <'])
+    assert exit.value.code == 2
+    assert 'invalid --where expression' in capsys.readouterr().err
+    assert transport.requests == []
+
+def test_alerts_page_size(transport, capsys):
+    alerts = [{'id': index} for index in range(5)]
+
+    def respond(method, url, kwargs):
+        params = kwargs['params']
+        start = (params['page'] - 1) * params['per_page']
+        return FakeResponse(200, alerts[start:start + params['per_page']])
+
+    transport.respond = respond
+    assert addytool_cli.main(['alerts', '--page-size', '2']) == 0
+    assert _lines(capsys) == alerts
+    assert [(kwargs['params']['per_page'], kwargs['params']['page']) \
+        for method, url, kwargs in transport.requests] == \
+        [(2, 1), (2, 2), (2, 3)]
+
+def test_commands_run_resumes_from_the_journal(transport, capsys, tmpdir):
+    failing = ['b']
+
+    def respond(method, url, kwargs):
+        agents = kwargs['json']['agents_ids']
+        if agents[0] in failing:
+            return FakeResponse(500, {'error': 'unavailable'})
+        return FakeResponse(200, {'actionids': [{'agentid': agents[0], \
+            'actionid': 'x-' + agents[0]}]})
+
+    transport.respond = respond
+    argv = ['commands', 'run', 'uptime', '--agent', 'a', '--agent', 'b', \
+        '--agent', 'c', '--page-size', '1', '--journal', \
+        str(tmpdir.join('journal.sqlite')), '--job', 'nightly']
+    assert addytool_cli.main(argv) == 0
+    first = _lines(capsys)
+    assert [line['arguments'][0] for line in first] == [['a'], ['b'], ['c']]
+    assert first[1]['result'] == {'error': 'unavailable'}
+    assert len(transport.requests) == 3
+
+    failing[:] = []
+    assert addytool_cli.main(argv) == 0
+    second = _lines(capsys)
+    assert [line['arguments'][0] for line in second] == [['b']]
+    assert second[0]['result']['actionids'][0]['actionid'] == 'x-b'
+    assert len(transport.requests) == 4
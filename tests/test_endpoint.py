@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import io, json
+
+import pytest
+
+import endpoint
+from conftest import FakeResponse
+
+def _reading(transport, statuses):
+    'Makes `transport` read the uploaded file, answering with `statuses`.'
+    uploaded = []
+
+    def respond(method, url, kwargs):
+        if method == 'GET':
+            return FakeResponse(200, 'https://upload.example.com/x')
+        uploaded.append(len(kwargs['files']['file'].read()))
+        return FakeResponse(statuses[len(uploaded) - 1], {'id': 'x'}, \
+            {'Retry-After': '0'})
+
+    transport.respond = respond
+    return uploaded
+
+def test_upload_retry_sends_the_whole_file_again(transport, tmpdir):
+    path = tmpdir.join('upload.bin')
+    path.write_binary(b'x' * 10000)
+    uploaded = _reading(transport, [429, 200])
+    assert endpoint.FileUpload().post(str(path)) == '{"id": "x"}'
+    assert uploaded == [10000, 10000]
+
+def test_unseekable_uploads_are_not_retried(transport):
+    class Unseekable(io.BytesIO):
+        def tell(self):
+            raise IOError('not seekable')
+
+    client = endpoint.FileUpload()
+    uploaded = _reading(transport, [429, 200])
+    response = endpoint.send(client, 'POST', 'https://upload.example.com/x', \
+        files = {'file': Unseekable(b'x' * 100)})
+    assert response.status_code == 429
+    assert uploaded == [100]
+
+def test_rate_limited_requests_are_retried(transport):
+    statuses = [429, 429, 200]
+    transport.respond = lambda method, url, kwargs: FakeResponse( \
+        statuses.pop(0), ['ok'], {'Retry-After': '0'})
+    assert endpoint.Policies().get() == ['ok']
+    assert len(transport.requests) == 3
+
+DOCUMENT = [1, 2.5, -0.125, 1e-7, 12345678901234, True, False, None, \
+    u'café ™ "quoted" \\\\', [], {}, [1.5, [2, {'a': 3.25}]], \
+    {'Battery Percentage': 42.0, 'name': u'日本', 'ok': True}]
+
+def _chunked(data, rng):
+    'Splits `data` at random points, including inside multi-byte characters.'
+    chunks, position = [], 0
+    while position < len(data):
+        size = rng.randint(1, 6)
+        chunks.append(data[position:position + size])
+        position += size
+    return chunks
+
+def test_iter_json_array_at_every_chunk_boundary():
+    import random
+    rng = random.Random(0)
+    for separators in ((',', ':'), (', ', ': ')):
+        data = json.dumps(DOCUMENT, separators = separators, \
+            ensure_ascii = False).encode('utf-8')
+        for split in range(len(data) + 1):
+            chunks = [data[:split], data[split:]]
+            assert list(endpoint.iter_json_array(chunks)) == DOCUMENT
+        for attempt in range(300):
+            assert list(endpoint.iter_json_array(_chunked(data, rng))) == \
+                DOCUMENT
+
+def test_iter_json_array_empty_and_whitespace():
+    assert list(endpoint.iter_json_array([b' [ ', b' ] \n'])) == []
+    assert list(endpoint.iter_json_array([b'[', b'1', b'0', b']'])) == [10]
+
+@pytest.mark.parametrize('data', [
+    b'', b'{"a": 1}', b'[1 2]', b'[1,,2]', b'[,1]', b'[1,]', b'[1] x', \
+    b'[1][2]', b'[1', b'[1,', b'[2.]', b'[tru]', b'["abc',
+    ])
+def test_iter_json_array_rejects_invalid_documents(data):
+    for split in range(len(data) + 1):
+        with pytest.raises(ValueError):
+            list(endpoint.iter_json_array([data[:split], data[split:]]))
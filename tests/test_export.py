@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import gzip, io, os
+
+import pytest
+
+import export
+
+def test_csv_writes_non_ascii_values(tmpdir):
+    for compress in (False, True):
+        writer = export.RotatingWriter(str(tmpdir.join('apps-%d' % compress)), \
+            format = 'csv', compress = compress)
+        writer.write({u'name': u'Café ™', u'version': u'1.0', \
+            u'meta': {u'vendor': u'日本'}})
+        path, = writer.close()
+        with (gzip.open if compress else io.open)(path, 'rb') as written:
+            data = written.read().decode('utf-8')
+        assert data == u'meta.vendor,name,version\r\n日本,Café ™,1.0\r\n'
+
+def _rows(count):
+    return ({'agentid': 'agent-%d' % (index // 50), 'name': 'App %d' % \
+        (index % 50), 'version': '1.%d' % (index % 7)} \
+        for index in range(count))
+
+def test_rotation_does_not_flush_the_compressor(tmpdir):
+    writer = export.RotatingWriter(str(tmpdir.join('once')), format = 'csv', \
+        compress = True, max_bytes = None)
+    writer.write_all(_rows(20000))
+    unrotated, = writer.close()
+    writer = export.RotatingWriter(str(tmpdir.join('rotated')), \
+        format = 'csv', compress = True)
+    writer.write_all(_rows(20000))
+    rotated, = writer.close()
+    assert os.path.getsize(rotated) <= os.path.getsize(unrotated) * 1.1
+
+def test_rotation(tmpdir):
+    writer = export.RotatingWriter(str(tmpdir.join('apps')), \
+        max_bytes = 64 * 1024)
+    writer.write_all(_rows(20000))
+    paths = writer.close()
+    assert len(paths) > 1
+    lines = 0
+    for path in paths:
+        with io.open(path, 'rb') as written:
+            data = written.read()
+        assert len(data) < 64 * 1024 + 16 * 1024
+        lines += data.count(b'\n')
+    assert lines == 20000
+
+def test_csv_warns_about_dropped_keys(tmpdir):
+    writer = export.RotatingWriter(str(tmpdir.join('devices')), \
+        format = 'csv')
+    writer.write({'agentid': 'a', 'OS Version': '14.0'})
+    with pytest.warns(UserWarning, match = 'Battery'):
+        writer.write({'agentid': 'b', 'Battery Percentage': 80})
+    writer.close()
+    with pytest.raises(ValueError):
+        export.export('devices', str(tmpdir), format = 'csv', records = [])
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+import filters
+
+DEVICES = [
+    {'agentid': 'a', 'OS Version': '14', 'Battery Percentage': 15, \
+        'FileVault Enabled': True, 'Device Name': 'mac-a'},
+    {'agentid': 'b', 'OS Version': '14.0.0', 'Battery Percentage': '80', \
+        'FileVault Enabled': False, 'Device Name': 'mac-b'},
+    {'agentid': 'c', 'OS Version': '13.6.1', 'Battery Percentage': 1, \
+        'FileVault Enabled': 1, 'Device Name': 'mac-c'},
+    {'agentid': 'd', 'OS Version': 'Unknown', 'Battery Percentage': True, \
+        'Device Name': 'lab-d'},
+    {'agentid': 'e', 'OS Version': 10.15, 'Battery Percentage': None},
+    {'agentid': 'f', 'OS Version': '14.2', 'Battery Percentage': 'n/a', \
+        'Device Name': 5},
+    ]
+
+def matches(expression, devices = DEVICES):
+    return sorted(filters.compile(expression).select(devices))
+
+@pytest.mark.parametrize('expression', [
+    '', '"OS Version" <', '"OS Version" 14', '("OS Version" < "14"', \
+    '"OS Version" < "14")', 'a == unquoted', 'a == b == c', 'not', \
+    '"OS Version" < "14" and', '"unterminated == 1',
+    ])
+def test_invalid_expressions_raise(expression):
+    with pytest.raises(ValueError):
+        filters.compile(expression)
+
+def test_parse_tree():
+    tree = filters.compile('not a = 1 and (b contains "x" or c >= 2.5)').tree
+    assert tree == ('and', ('not', ('compare', 'a', '==', 1)), \
+        ('or', ('compare', 'b', 'contains', 'x'), ('compare', 'c', '>=', 2.5)))
+
+def test_versions_ignore_trailing_zeros():
+    assert matches('"OS Version" == "14.0"') == ['a', 'b']
+    assert matches('"OS Version" == "14.0.0"') == ['a', 'b']
+    assert matches('"OS Version" < "14.0"') == ['c', 'e']
+    assert matches('"OS Version" >= "14.0"') == ['a', 'b', 'f']
+
+def test_strings_are_not_ordered_against_versions():
+    assert 'd' not in matches('"OS Version" < "14.0"')
+    assert 'd' not in matches('"OS Version" > "1.0"')
+    assert 'd' in matches('"OS Version" != "14.0"')
+
+def test_bools_are_not_numbers():
+    assert matches('"Battery Percentage" < 20') == ['a', 'c']
+    assert matches('"FileVault Enabled" == true') == ['a']
+    assert matches('"FileVault Enabled" == 1') == ['c']
+
+def test_mixed_kinds_are_not_ordered():
+    assert matches('"Device Name" > "a"') == ['a', 'b', 'c', 'd']
+    assert matches('"Device Name" < 10') == ['f']
+
+def test_missing_facts():
+    assert matches('"Battery Percentage" == null') == ['e']
+    assert matches('"FileVault Enabled" != true') == ['b', 'c', 'd', 'e', 'f']
+
+def test_contains_and_boolean_operators():
+    assert matches('"Device Name" contains "mac" and not "OS Version" ' \
+        '< "14"') == ['a', 'b']
+    assert matches('"Device Name" contains "lab" or "OS Version" == ' \
+        '"14.2"') == ['d', 'f']
+
+def _random_expression(rng, depth = 0):
+    if depth < 3 and rng.random() < 0.5:
+        operator = rng.choice(['and', 'or'])
+        expression = '(%s %s %s)' % (_random_expression(rng, depth + 1), \
+            operator, _random_expression(rng, depth + 1))
+        return ('not ' + expression) if rng.random() < 0.2 else expression
+    fact = rng.choice(['"OS Version"', '"Battery Percentage"', \
+        '"FileVault Enabled"', '"Device Name"', 'missing'])
+    operator = rng.choice(['==', '!=', '<', '<=', '>', '>=', 'contains'])
+    value = rng.choice(['"14.0"', '"13.6.1"', '20', '1', '15.5', 'true', \
+        'false', 'null', '"mac"', '"Unknown"'])
+    return '%s %s %s' % (fact, operator, value)
+
+def test_columns_and_rows_agree():
+    rng = random.Random(7)
+    columns = filters.Columns(DEVICES)
+    for attempt in range(500):
+        compiled = filters.compile(_random_expression(rng))
+        assert sorted(compiled.select(columns)) == \
+            sorted(compiled.select(DEVICES)), compiled
+
+def test_dotless_and_unquoted_versions():
+    fleet = [{'agentid': 'a', 'OS Version': '9.1'}, \
+        {'agentid': 'b', 'OS Version': '13.6.1'}, \
+        {'agentid': 'c', 'OS Version': '14.0'}, \
+        {'agentid': 'd', 'OS Version': '14.1'}]
+    assert matches('"OS Version" < "14"', fleet) == ['a', 'b']
+    assert matches('"OS Version" == "14"', fleet) == ['c']
+    assert matches('"OS Version" < 14', fleet) == ['a', 'b']
+    assert matches('"OS Version" >= 14', fleet) == ['c', 'd']
+    assert matches('"OS Version" == 14', fleet) == ['c']
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import journal, workflow
+from conftest import FakeResponse
+
+def test_resume_skips_completed_calls(transport):
+    log = journal.Journal(':memory:')
+    agent_ids = ['agent-%d' % i for i in range(5)]
+    first = workflow.bulk_command(agent_ids, 'uptime', journal = log, \
+        chunk_size = 2)
+    assert len(first) == 3
+    assert len(transport.requests) == 3
+    assert workflow.bulk_command(agent_ids, 'uptime', journal = log, \
+        chunk_size = 2) == []
+    assert len(transport.requests) == 3
+
+def test_interrupted_run_resumes_remaining_calls(transport):
+    log = journal.Journal(':memory:')
+    calls = []
+
+    def respond(method, url, kwargs):
+        calls.append(kwargs['json']['agents_ids'])
+        if len(calls) == 2:
+            raise IOError('connection reset')
+        return FakeResponse(200, {'ok': True})
+
+    transport.respond = respond
+    agent_ids = ['a', 'b', 'c']
+    try:
+        workflow.bulk_command(agent_ids, 'uptime', journal = log, chunk_size = 1)
+    except IOError:
+        pass
+    else:
+        raise AssertionError('expected the second call to fail')
+    assert workflow.bulk_command(agent_ids, 'uptime', journal = log, \
+        chunk_size = 1) == [{'ok': True}, {'ok': True}]
+    assert calls == [['a'], ['b'], ['b'], ['c']]
+
+def test_error_responses_are_failed_and_retried(transport):
+    log = journal.Journal(':memory:')
+    transport.respond = lambda method, url, kwargs: FakeResponse(500, \
+        {'error': 'injected error'})
+    agent_ids = ['a', 'b', 'c']
+    results = workflow.bulk_command(agent_ids, 'uptime', journal = log, \
+        chunk_size = 2)
+    assert results == [{'error': 'injected error'}] * 2
+    assert log.completed('command') == set()
+
+    transport.respond = lambda method, url, kwargs: FakeResponse(200, \
+        {'ok': True})
+    assert workflow.bulk_command(agent_ids, 'uptime', journal = log, \
+        chunk_size = 2) == [{'ok': True}] * 2
+    assert len(transport.requests) == 4
+    assert len(log.completed('command')) == 2
+
+def test_concurrent_bulk_keeps_order_and_journals_each_call(transport):
+    log = journal.Journal(':memory:')
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def respond(method, url, kwargs):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        threading.Event().wait(0.005)
+        with lock:
+            running[0] -= 1
+        return FakeResponse(200, {'agents': kwargs['json']['agents_ids']})
+
+    transport.respond = respond
+    agent_ids = ['agent-%d' % i for i in range(40)]
+    results = workflow.bulk_command(agent_ids, 'uptime', journal = log, \
+        chunk_size = 1, concurrency = 8)
+    assert [result['agents'] for result in results] == \
+        [[agent_id] for agent_id in agent_ids]
+    assert len(log.completed('command')) == 40
+    assert peak[0] > 1
+    assert workflow.bulk_command(agent_ids, 'uptime', journal = log, \
+        chunk_size = 1, concurrency = 8) == []
+    assert len(transport.requests) == 40
+
+def test_concurrent_error_responses_are_failed(transport):
+    log = journal.Journal(':memory:')
+
+    def respond(method, url, kwargs):
+        if kwargs['json']['agents_ids'][0].endswith('3'):
+            return FakeResponse(500, {'error': 'injected error'})
+        return FakeResponse(200, {'ok': True})
+
+    transport.respond = respond
+    agent_ids = ['agent-%d' % i for i in range(20)]
+    workflow.bulk_command(agent_ids, 'uptime', journal = log, chunk_size = 1, \
+        concurrency = 4)
+    assert len(log.completed('command')) == 18
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import os, stat
+
+import pytest
+
+import endpoint, metrics
+from conftest import FakeResponse
+
+@pytest.fixture
+def registry():
+    installed = metrics.Metrics().install()
+    yield installed
+    installed.uninstall()
+
+def test_rate_limited_request(transport, registry):
+    statuses = [429, 429, 200]
+    transport.respond = lambda method, url, kwargs: FakeResponse( \
+        statuses.pop(0), ['ok'], {'Retry-After': '0'})
+    assert endpoint.Policies().get() == ['ok']
+    text = registry.render()
+    labels = 'endpoint="Policies",method="GET"'
+    assert 'addytool_request_duration_seconds_bucket{%s,le="0.005"} 3' % \
+        labels in text
+    assert 'addytool_request_duration_seconds_bucket{%s,le="+Inf"} 3' % \
+        labels in text
+    assert 'addytool_request_duration_seconds_count{%s} 3' % labels in text
+    assert 'addytool_requests_total{%s,status="429"} 2' % labels in text
+    assert 'addytool_requests_total{%s,status="200"} 1' % labels in text
+    assert 'addytool_response_bytes_total{%s} 18' % labels in text
+    assert 'addytool_retries_total{%s} 2' % labels in text
+    assert 'addytool_request_errors_total{' not in text
+
+def test_histogram_is_cumulative():
+    histogram = metrics.Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [('0.1', 1), ('1.0', 3), ('+Inf', 4)]
+
+def test_write_is_world_readable(tmpdir, registry):
+    path = str(tmpdir.join('addytool.prom'))
+    registry.write(path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    with open(path) as written:
+        assert written.read() == registry.render()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import endpoint, organizations
+from conftest import FakeResponse
+
+class HeaderTransport(object):
+    'Records the session and client-id of each request.'
+
+    def __init__(self, fail = ()):
+        self.fail = fail
+        self.requests = []
+
+    def request(self, session, method, url, headers = None, **kwargs):
+        self.requests.append((session, headers['client-id']))
+        if headers['client-id'] in self.fail:
+            raise IOError('connection refused')
+        return FakeResponse(200, [headers['client-id']])
+
+@pytest.fixture
+def headers(monkeypatch):
+    fake = HeaderTransport()
+    monkeypatch.setattr(endpoint, 'transport', fake)
+    return fake
+
+def _organizations(*orgids):
+    return [organizations.Organization(orgid, 'id-' + orgid, \
+        'secret-' + orgid, rate = 1000) for orgid in orgids]
+
+def test_endpoint_binds_the_organization(headers):
+    organization, = _organizations('a')
+    for endpoint_class in (endpoint.Alerts, endpoint.FileUpload):
+        instance = organization.endpoint(endpoint_class)
+        assert instance.headers == {'client-id': 'id-a', \
+            'client-secret': 'secret-a'}
+        assert instance.session is organization.session
+        assert instance.rate_limiter is organization.rate_limiter
+        assert endpoint_class.organization is None
+    assert organization.endpoint(endpoint.Alerts).get() == ['id-a']
+    assert headers.requests == [(organization.session, 'id-a')]
+    assert endpoint.Alerts().headers['client-id'] == 'test'
+
+def test_fan_out_isolates_failing_organizations(headers):
+    headers.fail = ('id-b',)
+    multi = organizations.MultiOrg(_organizations('a', 'b', 'c'), \
+        concurrency = 3)
+    results = dict((orgid, (result, error)) for orgid, result, error \
+        in multi.fan_out(endpoint.Policies))
+    assert results['a'] == (['id-a'], None)
+    assert results['c'] == (['id-c'], None)
+    assert results['b'][0] is None and isinstance(results['b'][1], IOError)
+    assert list(multi.failures) == ['b']
+    headers.fail = ()
+    assert multi.collect(endpoint.Policies) == {'a': ['id-a'], \
+        'b': ['id-b'], 'c': ['id-c']}
+    assert multi.failures == {}
+
+class FakeTime(object):
+    'A clock that only moves when slept on.'
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def test_rate_limiter_paces_requests(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(organizations, 'time', clock)
+    limiter = organizations.RateLimiter(rate = 8, burst = 2)
+    for _ in range(5):
+        limiter.acquire()
+    assert clock.sleeps == [0.125] * 3
+    clock.now += 10
+    limiter.acquire()
+    limiter.acquire()
+    assert len(clock.sleeps) == 3
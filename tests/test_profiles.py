@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import endpoint, profiles
+from conftest import FakeResponse
+
+PROFILES = [
+    {'instructionId': 'p1', 'payloads': [{'PayloadIdentifier': 'com.wifi'}]},
+    {'instruction_id': 'p2', 'payloads': [{'payload_identifier': 'com.wifi'}, \
+        {'PayloadIdentifier': 'com.vpn'}]},
+    {'instructionid': 'p3', 'payloads': [{'PayloadIdentifier': 'com.vpn'}]},
+    {'instructionId': 'p4', 'payloads': ['not a payload']},
+    {'name': 'no instruction id'},
+    ]
+
+def _server(transport, answers = None):
+    'Lists PROFILES and answers deletes from `answers`, raising on errors.'
+    def respond(method, url, kwargs):
+        if method == 'GET':
+            return FakeResponse(200, PROFILES)
+        answer = answers[kwargs['json']['instruction_id']]
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(200, answer)
+    transport.respond = respond
+
+def test_get_sends_instruction_id_as_a_query_parameter(transport):
+    _server(transport)
+    endpoint.Profiles().get('p1')
+    endpoint.Profiles().get()
+    assert [kwargs['params'] for method, url, kwargs in transport.requests] \
+        == [{'instruction_id': 'p1'}, {}]
+
+def test_indexes(transport):
+    _server(transport)
+    store = profiles.ProfileStore()
+    assert len(store) == 4
+    assert store.get('p2') == PROFILES[1]
+    assert store.get('missing') is None
+    assert sorted(store.get_many(['p1', 'p3', 'missing'])) == ['p1', 'p3']
+    assert sorted(profiles.instruction_id(profile) for profile \
+        in store.find_payload('com.vpn')) == ['p2', 'p3']
+    assert store.find_payload('com.nothing') == []
+    assert len(transport.requests) == 1
+
+def test_delete_many_forgets_only_deleted_profiles(transport):
+    error = IOError('connection reset')
+    _server(transport, {'p1': 'ok', 'p2': 'Instruction not found', \
+        'p3': 'error', 'p4': error})
+    store = profiles.ProfileStore(concurrency = 4)
+    results = store.delete_many(['p1', 'p2', 'p3', 'p4'])
+    assert results == {'p1': 'ok', 'p2': 'Instruction not found', \
+        'p3': 'error', 'p4': error}
+    assert sorted(profile_id for profile_id in ['p1', 'p2', 'p3', 'p4'] \
+        if profile_id in store) == ['p3', 'p4']
+    assert [profiles.instruction_id(profile) for profile \
+        in store.find_payload('com.vpn')] == ['p3']
+    assert store.find_payload('com.wifi') == []
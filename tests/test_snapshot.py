@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import snapshot
+
+def test_default_names_are_unique_within_a_second():
+    store = snapshot.SnapshotStore(':memory:')
+    devices = [{'agentid': 'a', 'OS Version': '14.1'}]
+    names = [store.save(devices) for i in range(5)]
+    assert len(set(names)) == 5
+    assert store.names() == names
+
+FLEET = [
+    {'agentid': 'a', 'OS Version': '14.1', 'Battery Percentage': 80},
+    {'agentid': 'b', 'OS Version': '13.6', 'FileVault Enabled': True},
+    {'agentid': 'c', 'OS Version': '14.0'},
+    {'Device Name': 'no agentid'},
+    ]
+
+def _later():
+    a, b, c = [dict(facts) for facts in FLEET[:3]]
+    a['Battery Percentage'] = 35
+    b['OS Version'] = '14.1'
+    del b['FileVault Enabled']
+    b['Firewall Enabled'] = False
+    return [a, b, {'agentid': 'd', 'OS Version': '14.2'}]
+
+def test_diff():
+    store = snapshot.SnapshotStore(':memory:')
+    old = store.save(FLEET, name = 'monday')
+    new = store.save(_later(), name = 'tuesday')
+    delta = store.diff(old, new)
+    assert delta['added'] == {'d': {'agentid': 'd', 'OS Version': '14.2'}}
+    assert delta['removed'] == {'c': FLEET[2]}
+    assert delta['changed'] == {
+        'a': {'Battery Percentage': [80, 35]},
+        'b': {'OS Version': ['13.6', '14.1'], \
+            'FileVault Enabled': [True, None], \
+            'Firewall Enabled': [None, False]},
+        }
+    assert store.diff(new, new) == {'added': {}, 'removed': {}, 'changed': {}}
+    assert store.load(new) == dict((facts['agentid'], facts) \
+        for facts in _later())
+
+def test_unchanged_facts_are_stored_once():
+    store = snapshot.SnapshotStore(':memory:')
+
+    def stored():
+        return store.connection.execute('SELECT COUNT(*) FROM facts') \
+            .fetchone()[0]
+
+    names = [store.save(FLEET) for night in range(3)]
+    assert stored() == 3
+    store.save(_later())
+    assert stored() == 6
+    for name in names:
+        store.delete(name)
+    assert stored() == 3
+    assert store.load(store.names()[0]) == \
+        dict((facts['agentid'], facts) for facts in _later())
+
+def test_stores_written_by_earlier_versions_are_migrated(tmpdir):
+    path = str(tmpdir.join('old.sqlite'))
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE snapshots (id INTEGER PRIMARY KEY \
+        AUTOINCREMENT, name TEXT NOT NULL UNIQUE, created REAL NOT NULL, \
+        devices INTEGER NOT NULL)')
+    connection.execute('CREATE TABLE devices (snapshot INTEGER NOT NULL, \
+        agentid TEXT NOT NULL, digest TEXT NOT NULL, facts TEXT NOT NULL, \
+        PRIMARY KEY (snapshot, agentid)) WITHOUT ROWID')
+    connection.execute("INSERT INTO snapshots VALUES (1, 'old', 0, 1)")
+    connection.execute("INSERT INTO devices VALUES (1, 'a', 'x', \
+        '{\"agentid\":\"a\"}')")
+    connection.commit()
+    connection.close()
+    store = snapshot.SnapshotStore(path)
+    assert store.load('old') == {'a': {'agentid': 'a'}}
+    new = store.save([{'agentid': 'a', 'OS Version': '14.1'}])
+    assert store.diff('old', new)['changed'] == \
+        {'a': {'OS Version': [None, '14.1']}}
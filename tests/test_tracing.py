@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import json, os, pstats
+
+import pytest
+
+import tracing, workflow
+from conftest import FakeResponse
+
+def test_traced_workflow_call(transport, tmpdir):
+    pytest.importorskip('tracemalloc')
+    transport.respond = lambda method, url, kwargs: FakeResponse(200, \
+        [{'agentid': 'a', 'OS Version': '13.6'}, \
+        {'agentid': 'b', 'OS Version': '14.1'}])
+    path = str(tmpdir.join('select.trace.json'))
+    with tracing.Tracer(allocations = True, profile = True) as tracer:
+        assert workflow.select_devices('"OS Version" < "14"') == ['a']
+    tracer.write(path)
+    assert tracing.active is None
+
+    with open(path) as written:
+        events = json.load(written)['traceEvents']
+    spans = dict((event['name'], event) for event in events)
+    assert set(spans) >= set(['workflow.select_devices', 'Devices.get', \
+        'Devices GET', 'json.loads'])
+    for event in events:
+        assert event['ph'] == 'X'
+        assert event['args']['cpu_ms'] >= 0
+        assert isinstance(event['args']['alloc_bytes'], int)
+    assert spans['workflow.select_devices']['cat'] == 'workflow'
+    assert 'parent' not in spans['workflow.select_devices']['args']
+    assert spans['Devices.get']['args']['parent'] == 'workflow.select_devices'
+    assert spans['Devices GET']['args']['parent'] == 'Devices.get'
+    assert spans['Devices GET']['args']['status'] == 200
+    assert spans['json.loads']['args']['parent'] == 'Devices.get'
+    outer = spans['workflow.select_devices']
+    for name in ('Devices.get', 'Devices GET', 'json.loads'):
+        assert outer['ts'] <= spans[name]['ts']
+        assert spans[name]['ts'] + spans[name]['dur'] <= \
+            outer['ts'] + outer['dur'] + 1
+
+    assert os.path.exists(path + '.prof')
+    functions = [function for _, _, function \
+        in pstats.Stats(path + '.prof').stats]
+    assert 'select_devices' in functions
+
+def test_no_tracer_is_a_no_op(transport):
+    assert tracing.active is None
+    with tracing.span('anything') as span:
+        assert span is tracing._NULL_SPAN
+    assert workflow.select_devices('a == 1', [{'agentid': 'x', 'a': 1}]) \
+        == ['x']
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import gzip
+
+import pytest
+
+import endpoint, transport
+from conftest import FakeResponse, FakeTransport
+
+class FakeSession(object):
+    'Stands in for `requests`, answering through a FakeTransport.'
+
+    def __init__(self, fake):
+        self.fake = fake
+
+    def request(self, method, url, **kwargs):
+        return self.fake.request(self, method, url, **kwargs)
+
+def _responder():
+    'Answers devices and uploads; api/policies answers [1], [2], [3], ...'
+    policies = []
+
+    def respond(method, url, kwargs):
+        if 'upload' in url or 'storage' in url:
+            if method == 'GET':
+                return FakeResponse(200, 'https://storage.example.com/put')
+            return FakeResponse(200, {'id': 'file-1'})
+        if url.endswith('api/devices'):
+            return FakeResponse(200, [{'agentid': 'a'}, {'agentid': u'b ™'}])
+        policies.append(url)
+        return FakeResponse(200, [len(policies)])
+    return respond
+
+def _run(path):
+    results = [endpoint.Devices().get(), list(endpoint.Devices().stream( \
+        chunk_size = 3)), endpoint.FileUpload().post(path)]
+    results += [endpoint.Policies().get() for _ in range(3)]
+    return results
+
+@pytest.fixture
+def secrets(monkeypatch):
+    values = {'ClientID': 'id-0123456789', 'ClientSecret': 'secret-9876543210'}
+    monkeypatch.setattr(endpoint.keyring, 'get_password', \
+        lambda service, name: values[name])
+    return values
+
+def test_record_and_replay(monkeypatch, tmpdir, secrets):
+    upload = tmpdir.join('upload.txt')
+    upload.write('hello')
+    cassette = str(tmpdir.join('run.cassette.gz'))
+    fake = FakeTransport(_responder())
+    monkeypatch.setattr(endpoint, 'requests', FakeSession(fake))
+    with transport.Recorder(cassette) as recorder:
+        recorded = _run(str(upload))
+    assert recorder.count == len(fake.requests) == 7
+    assert recorded[0] == recorded[1] == [{'agentid': 'a'}, {'agentid': u'b ™'}]
+    assert [result[0] for result in recorded[3:]] == [1, 2, 3]
+
+    with gzip.open(cassette, 'rb') as saved:
+        data = saved.read()
+    assert b'REDACTED' in data
+    for secret in secrets.values():
+        assert secret.encode('ascii') not in data
+
+    monkeypatch.setattr(endpoint, 'requests', None)
+    with transport.Replayer(cassette) as replayer:
+        assert _run(str(upload)) == recorded
+        assert endpoint.Policies().get() == [3]
+        with pytest.raises(KeyError):
+            endpoint.Alerts().get()
+    assert replayer.misses == 1
+    assert endpoint.transport is None
+
+def test_scrub_is_case_insensitive():
+    assert transport.scrub({'Client-Secret': 'x', 'Accept': 'json'}) == \
+        {'Client-Secret': 'REDACTED', 'Accept': 'json'}
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import pytest
+
+import watch
+
+class FakeOnline(object):
+    'Answers each `get` with the next response, repeating the last one.'
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def get(self):
+        if len(self.responses) > 1:
+            return self.responses.pop(0)
+        return self.responses[0]
+
+def _devices(*agentids):
+    return [{'agentid': agentid, 'name': 'mac-' + agentid} \
+        for agentid in agentids]
+
+def _watcher(*responses, **kwargs):
+    kwargs.setdefault('interval', 0)
+    kwargs.setdefault('min_interval', 0)
+    return watch.OnlineWatcher(FakeOnline(*responses), **kwargs)
+
+def test_events_are_set_differences():
+    watcher = _watcher(_devices('a', 'b'), _devices('b', 'c', 'd'), \
+        _devices('b', 'c', 'd'))
+    assert watcher.poll() == []
+    events = watcher.poll()
+    assert sorted(events) == [('offline', 'a', _devices('a')[0]), \
+        ('online', 'c', _devices('c')[0]), ('online', 'd', _devices('d')[0])]
+    assert watcher.poll() == []
+    assert sorted(watcher.online) == ['b', 'c', 'd']
+
+def test_emit_initial():
+    watcher = _watcher(_devices('a'), emit_initial = True)
+    assert watcher.poll() == [('online', 'a', _devices('a')[0])]
+
+def test_error_responses_raise():
+    watcher = _watcher({'error': 'Unauthorized'})
+    with pytest.raises(ValueError):
+        watcher.poll()
+    watcher = _watcher(['not a device'])
+    with pytest.raises(ValueError):
+        watcher.poll()
+
+def test_adapt_stays_within_bounds():
+    watcher = _watcher([], interval = 30, min_interval = 5, \
+        max_interval = 300)
+    watcher.adapt(0, 100)
+    assert watcher.interval == 45
+    for _ in range(20):
+        watcher.adapt(0, 100)
+    assert watcher.interval == 300
+    watcher.adapt(1, 1000)
+    assert watcher.interval == 240
+    watcher.adapt(50, 1000)
+    assert watcher.interval == 120
+    for _ in range(20):
+        watcher.adapt(50, 1000)
+    assert watcher.interval == 5
+
+def test_callbacks_and_run():
+    watcher = _watcher(_devices('a'), _devices('a', 'b'), _devices('b'))
+    seen = []
+    watcher.on_change(lambda event, agentid, facts: seen.append( \
+        (event, agentid)))
+    watcher.run(polls = 3)
+    assert seen == [('online', 'b'), ('offline', 'a')]
+
+def test_iteration_stops():
+    watcher = _watcher(_devices('a'), _devices('a', 'b'), _devices('b'))
+    iterator = iter(watcher)
+    assert next(iterator)[:2] == ('online', 'b')
+    assert next(iterator)[:2] == ('offline', 'a')
+    watcher.stop()
+    with pytest.raises(StopIteration):
+        next(iterator)
+
+# `async for` is a syntax error on Python 2, so the coroutine is compiled
+# only when the test runs.
+COLLECT = """
+async def collect(watcher, count):
+    events = []
+    async for event in watcher:
+        events.append(event)
+        if len(events) == count:
+            watcher.stop()
+    return events
+"""
+
+def test_async_iteration():
+    asyncio = pytest.importorskip('asyncio')
+    if sys.version_info < (3, 5):
+        pytest.skip('async for needs Python 3.5')
+    namespace = {}
+    exec(COLLECT, namespace)
+    watcher = _watcher(_devices('a'), _devices('b'))
+    loop = asyncio.new_event_loop()
+    try:
+        events = loop.run_until_complete(namespace['collect'](watcher, 2))
+    finally:
+        loop.close()
+    assert sorted(event[:2] for event in events) == \
+        [('offline', 'a'), ('online', 'b')]
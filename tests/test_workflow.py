@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import workflow
+
+def test_paginate_reads_every_page():
+    pages = {1: [1, 2], 2: [3, 4], 3: [5]}
+    get = lambda per_page, page: pages[page]
+    assert list(workflow.paginate(get, per_page = 2)) == [1, 2, 3, 4, 5]
+
+def test_paginate_raises_on_error_pages():
+    pages = {1: [1, 2], 2: {'error': 'injected error'}}
+    items = workflow.paginate(lambda per_page, page: pages[page], per_page = 2)
+    assert next(items) == 1
+    assert next(items) == 2
+    with pytest.raises(ValueError):
+        next(items)